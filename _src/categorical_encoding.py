@@ -0,0 +1,147 @@
+import numpy
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+# the values of the yes/no columns, no is coded 0 and yes 1
+FLAG_VOCABULARY = ['no', 'yes']
+
+# the other spellings of the flags, the form sends 1/0 and the compact schema may give booleans
+FLAG_ALIASES = {
+    '0': 'no', '0.0': 'no', 'False': 'no', 'false': 'no', 'No': 'no', 'NO': 'no',
+    '1': 'yes', '1.0': 'yes', 'True': 'yes', 'true': 'yes', 'Yes': 'yes', 'YES': 'yes',
+}
+
+
+# we will turn raw categorical values into integer codes with lookup tables, the same fitted encoder is pickled
+# into the preprocessor so training and serving encode every value the same way
+class DictionaryEncoder(TransformerMixin, BaseEstimator):
+    def __init__(self, categories='auto', aliases=None, output='onehot', handle_unknown='error'):
+        """
+        we will initialize the encoder
+        args:
+            categories: 'auto' or list - the categories of every column, 'auto' learns the sorted values seen in fit
+            aliases: dict - other spellings of a category (for example {'1': 'yes'}), matched on str(value)
+            output: str - 'onehot' gives one column per category, 'ordinal' gives the code of the category
+            handle_unknown: str - 'error' raises on a value that is not a category, 'ignore' gives an all zero onehot row
+        returns:
+            none
+        """
+        self.categories = categories
+        self.aliases = aliases
+        self.output = output
+        self.handle_unknown = handle_unknown
+
+    def _columns(self, X):
+        """
+        we will split the input into one array per column without copying a dataframe
+        """
+        if isinstance(X, pd.DataFrame):
+            return [X.iloc[:, i] for i in range(X.shape[1])]
+        X = numpy.asarray(X, dtype=object)
+        X = X.reshape(-1, 1) if X.ndim == 1 else X
+        return [X[:, i] for i in range(X.shape[1])]
+
+    def _canonical(self, value):
+        key = str(value)
+        return (self.aliases or {}).get(key, key)
+
+    def fit(self, X, y=None):
+        """
+        we will learn (or take) the categories of every column and build the lookup tables
+        args:
+            X - a dataframe or a 2D array of raw values
+        returns:
+            DictionaryEncoder - the fitted encoder
+        """
+        if self.output not in ('onehot', 'ordinal'):
+            raise ValueError(f"output must be 'onehot' or 'ordinal', not {self.output}.")
+        if self.handle_unknown not in ('error', 'ignore'):
+            raise ValueError(f"handle_unknown must be 'error' or 'ignore', not {self.handle_unknown}.")
+        if self.output == 'ordinal' and self.handle_unknown == 'ignore':
+            raise ValueError("an ordinal code has no value for unknown categories, use handle_unknown='error'.")
+
+        columns = self._columns(X)
+        if isinstance(X, pd.DataFrame):
+            self.feature_names_in_ = numpy.asarray(X.columns, dtype=object)
+        self.n_features_in_ = len(columns)
+
+        if self.categories == 'auto':
+            self.categories_ = [numpy.array(sorted({self._canonical(value) for value in pd.unique(column)}), dtype=object)
+                                for column in columns]
+        else:
+            if len(self.categories) != len(columns):
+                raise ValueError(f"there are categories for {len(self.categories)} columns but X has {len(columns)}.")
+            self.categories_ = [numpy.array([str(value) for value in categories], dtype=object) for categories in self.categories]
+
+        # every accepted spelling of a value and its code
+        self.lookups_ = []
+        for categories in self.categories_:
+            lookup = {category: code for code, category in enumerate(categories.tolist())}
+            for alias, category in (self.aliases or {}).items():
+                if category in lookup:
+                    lookup.setdefault(alias, lookup[category])
+            self.lookups_.append(lookup)
+
+        # the onehot rows of every code, the last row (code -1) is the all zero row of an unknown value
+        self.tables_ = [numpy.vstack([numpy.eye(len(categories)), numpy.zeros((1, len(categories)))])
+                        for categories in self.categories_]
+        return self
+
+    def encode(self, X):
+        """
+        we will look up the code of every value, each distinct value of a column is looked up once
+        args:
+            X - a dataframe or a 2D array of raw values
+        returns:
+            numpy.array - the codes (rows x columns, int32), -1 for an ignored unknown value
+        """
+        columns = self._columns(X)
+        if len(columns) != self.n_features_in_:
+            raise ValueError(f"X has {len(columns)} columns but the encoder was fitted on {self.n_features_in_}.")
+
+        codes = numpy.empty((len(columns[0]) if columns else 0, len(columns)), dtype=numpy.int32)
+        for i, column in enumerate(columns):
+            if isinstance(column, pd.Series) and isinstance(column.dtype, pd.CategoricalDtype):
+                # the category codes are already an index into the categories of the column
+                uniques, inverse = column.cat.categories.tolist(), column.cat.codes.to_numpy()
+                if (inverse < 0).any():
+                    uniques, inverse = uniques + [numpy.nan], numpy.where(inverse < 0, len(uniques), inverse)
+            else:
+                uniques, inverse = numpy.unique(numpy.asarray(column).astype(str), return_inverse=True)
+                uniques = uniques.tolist()
+
+            lookup = self.lookups_[i]
+            table = numpy.array([lookup.get(str(value), -1) for value in uniques], dtype=numpy.int32)
+            column_codes = numpy.take(table, inverse.ravel()) if len(table) else numpy.empty(0, dtype=numpy.int32)
+            if self.handle_unknown == 'error' and (column_codes < 0).any():
+                unknown = sorted({str(value) for value, code in zip(uniques, table.tolist()) if code < 0})
+                name = self.feature_names_in_[i] if hasattr(self, 'feature_names_in_') else i
+                raise ValueError(f"Found unknown categories {unknown} in column '{name}'")
+            codes[:, i] = column_codes
+        return codes
+
+    def transform(self, X):
+        """
+        we will encode the raw values
+        args:
+            X - a dataframe or a 2D array of raw values
+        returns:
+            numpy.array - the onehot columns or the codes of every column as floats
+        """
+        codes = self.encode(X)
+        if self.output == 'ordinal':
+            return codes.astype(float)
+        if codes.shape[1] == 0:
+            return numpy.empty((len(codes), 0))
+        return numpy.hstack([numpy.take(table, codes[:, i], axis=0) for i, table in enumerate(self.tables_)])
+
+    def get_feature_names_out(self, input_features=None):
+        """
+        we will name the output columns like sklearn's OneHotEncoder (column_category)
+        """
+        if input_features is None:
+            input_features = getattr(self, 'feature_names_in_', [f"x{i}" for i in range(self.n_features_in_)])
+        if self.output == 'ordinal':
+            return numpy.asarray(input_features, dtype=object)
+        return numpy.asarray([f"{name}_{category}" for name, categories in zip(input_features, self.categories_)
+                              for category in categories.tolist()], dtype=object)
@@ -3,9 +3,262 @@ import numpy
 import pandas as pd
 from abc import ABC, abstractmethod
 import zipfile
+import json
+import time
+import hashlib
+import logging
+import tracemalloc
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+
+# where every ingestor leaves the raw data for the splitting step
+RAW_DATA_PATH = "data/raw_data/raw.csv"
+
+# the columns of the housing data and the types we read them with, no type inference is done
+HOUSING_SCHEMA = {
+    'price': 'int64',
+    'area': 'int64',
+    'bedrooms': 'int64',
+    'bathrooms': 'int64',
+    'stories': 'int64',
+    'mainroad': 'object',
+    'guestroom': 'object',
+    'basement': 'object',
+    'hotwaterheating': 'object',
+    'airconditioning': 'object',
+    'parking': 'int64',
+    'prefarea': 'object',
+    'furnishingstatus': 'object'
+}
+
+# where the chunked ingestor leaves the raw data with the compact schema
+RAW_PARQUET_PATH = "data/raw_data/raw.parquet"
+
+# the yes/no columns of the housing data
+FLAG_COLUMNS = ['mainroad', 'guestroom', 'basement', 'hotwaterheating', 'airconditioning', 'prefarea']
+
+# the values furnishingstatus can take, fixed so every chunk gets the same categories
+FURNISHING_STATUSES = ['furnished', 'semi-furnished', 'unfurnished']
+
+# the flags keep their yes/no labels (which the preprocessor is fitted on) in a one byte category
+FLAG_DTYPE = pd.CategoricalDtype(['no', 'yes'])
+
+# other spellings of the flags we accept
+FLAG_SPELLINGS = {'true': 'yes', '1': 'yes', '1.0': 'yes', 'false': 'no', '0': 'no', '0.0': 'no'}
+
+# the smallest types that hold the housing data, the flags and furnishingstatus are categories
+COMPACT_HOUSING_SCHEMA = {
+    'price': 'int32',
+    'area': 'int32',
+    'bedrooms': 'int16',
+    'bathrooms': 'int16',
+    'stories': 'int16',
+    'mainroad': FLAG_DTYPE,
+    'guestroom': FLAG_DTYPE,
+    'basement': FLAG_DTYPE,
+    'hotwaterheating': FLAG_DTYPE,
+    'airconditioning': FLAG_DTYPE,
+    'parking': 'int16',
+    'prefarea': FLAG_DTYPE,
+    'furnishingstatus': pd.CategoricalDtype(FURNISHING_STATUSES)
+}
+
+
+def _csv_dtypes(schema: dict):
+    """
+    we will give the csv reader the types of our schema, categories are read with the values found and checked after
+    args:
+        schema: dict - the column types we want
+    returns:
+        dict - the types to read the csv with
+    """
+    return {column: ('category' if isinstance(dtype, pd.CategoricalDtype) else dtype) for column, dtype in schema.items()}
+
+
+def apply_schema(df: pd.DataFrame, schema: dict=COMPACT_HOUSING_SCHEMA):
+    """
+    we will cast the columns of the dataframe to the schema, a value that is not one of the categories is an error
+    args:
+        df: pd.Dataframe - the data we want to cast
+        schema: dict - the column types we want
+    returns:
+        pd.Dataframe - the data with the schema types
+    """
+    df = df[list(schema)].copy()
+    for column, dtype in schema.items():
+        if isinstance(dtype, pd.CategoricalDtype) and df[column].dtype != dtype:
+            values = df[column].astype(object)
+            if dtype == FLAG_DTYPE:
+                values = values.map(lambda value: FLAG_SPELLINGS.get(str(value).lower(), str(value).lower()), na_action='ignore')
+            cast = values.astype(dtype)
+            unknown = cast.isna() & values.notna()
+            if unknown.any():
+                raise ValueError(f"the column {column} has values that are not one of {list(dtype.categories)}: "
+                                 f"{sorted(map(str, values[unknown].unique()))[:5]}")
+            df[column] = cast
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def read_raw_data(path: str=RAW_DATA_PATH, schema: dict=COMPACT_HOUSING_SCHEMA):
+    """
+    we will read the raw data (csv or parquet) with the compact schema
+    args:
+        path: str - the raw data written by one of the ingestors
+        schema: dict - the column types we want, none keeps the types pandas infers
+    returns:
+        pd.Dataframe - the raw data
+    """
+    file_format = detect_format(path)
+    if file_format == 'directory':
+        return read_raw_store(path, schema=schema)
+    if file_format == 'parquet':
+        df = pd.read_parquet(path, columns=list(schema) if schema is not None else None)
+    else:
+        df = pd.read_csv(path, dtype=_csv_dtypes(schema) if schema is not None else None)
+    return apply_schema(df, schema) if schema is not None else df
+
+
+def read_raw_rows(path: str, rows, columns: list=None, schema: dict=COMPACT_HOUSING_SCHEMA):
+    """
+    we will read only the given rows (and columns) of the raw data. parquet files and the raw store are read
+    row group by row group with pyarrow's take, a csv file has to be parsed whole, so read all the rows you need in one call
+    args:
+        path: str - the raw data written by one of the ingestors
+        rows: array - the positions of the rows we want, in the order we want them
+        columns: list - the columns we want, none reads all the columns of the schema
+        schema: dict - the column types we want
+    returns:
+        pd.Dataframe - the rows with a fresh index
+    """
+    columns = list(columns) if columns is not None else list(schema)
+    schema = {column: schema[column] for column in columns}
+
+    file_format = detect_format(path)
+    if file_format == 'directory':
+        dataset = _store_dataset(path, _read_watermarks(path))
+    elif file_format == 'parquet':
+        dataset = ds.dataset(path, format='parquet')
+    else:
+        return read_raw_data(path, schema=schema).iloc[rows].reset_index(drop=True)
+
+    table = dataset.take(pa.array(rows, type=pa.int64()), columns=columns)
+    return apply_schema(table.to_pandas(), schema)
+
+
+def iter_raw_chunks(path: str=RAW_DATA_PATH, chunksize: int=100000, schema: dict=COMPACT_HOUSING_SCHEMA):
+    """
+    we will read the raw data chunk by chunk with the compact schema, so it never has to fit in memory
+    args:
+        path: str - the raw data written by one of the ingestors
+        chunksize: int - the number of rows of a chunk (parquet chunks follow the batches of the file)
+        schema: dict - the column types we want
+    returns:
+        iterator - the chunks as dataframes, in the order of the raw data
+    """
+    file_format = detect_format(path)
+    if file_format in ('directory', 'parquet'):
+        if file_format == 'directory':
+            dataset = _store_dataset(path, _read_watermarks(path))
+            if dataset is None:
+                return
+        else:
+            dataset = ds.dataset(path, format='parquet')
+        for batch in dataset.to_batches(columns=list(schema), batch_size=chunksize):
+            if batch.num_rows > 0:
+                yield apply_schema(batch.to_pandas(), schema)
+    else:
+        for chunk in pd.read_csv(path, dtype=_csv_dtypes(schema), chunksize=chunksize):
+            yield apply_schema(chunk, schema)
+
+
+# where the incremental ingestor appends the deltas, one partition per watermark
+RAW_STORE_DIR = "data/raw_data/store"
+
+# the log of the deltas in the raw store
+WATERMARKS_FILE = "_watermarks.json"
+
+# where we remember the hashes of the sources we ingested and the outputs they produced
+MANIFEST_PATH = "data/raw_data/ingest_manifest.json"
+
+
+# arrow types for the pandas dtypes used in our schemas
+ARROW_TYPES = {
+    'int64': pa.int64(),
+    'float64': pa.float64(),
+    'object': pa.string(),
+}
+
+# the first bytes of every file format we can ingest, anything else is read as plain csv
+MAGIC_BYTES = (
+    (b'PK\x03\x04', 'zip'),
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'ipc'),
+    (b'FEA1', 'ipc'),
+    (b'\x1f\x8b', 'csv'),
+    (b'\x28\xb5\x2f\xfd', 'csv'),
+)
+
+# the file extensions of every format, checked before the magic bytes
+EXTENSIONS = {
+    '.zip': 'zip',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'ipc',
+    '.feather': 'ipc',
+    '.ipc': 'ipc',
+    '.csv': 'csv',
+    '.gz': 'csv',
+    '.zst': 'csv',
+}
+
+
+def detect_format(file_path: str):
+    """
+    we will find the format of a file from its extension, or from its first bytes when the extension is unknown
+    args:
+        file_path: str - the file or directory we want to ingest
+    returns:
+        str - one of zip, parquet, ipc, csv or directory
+    """
+    if os.path.isdir(file_path):
+        return 'directory'
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in EXTENSIONS:
+        return EXTENSIONS[extension]
+
+    with open(file_path, 'rb') as file:
+        head = file.read(8)
+    for magic, file_format in MAGIC_BYTES:
+        if head.startswith(magic):
+            return file_format
+    return 'csv'
+
 
 # create a base ingestor class
 class DataIngestor(ABC):
+    # the formats (see detect_format) this ingestor accepts
+    formats = ()
+
+    # where the ingestor writes the raw data
+    _output_path = RAW_DATA_PATH
+
+    # false when the ingestor keeps track of what it ingested itself and the manifest should not be used
+    cacheable = True
+
+    def cache_config(self):
+        """
+        we will describe the ingestor and its options, a change here means the raw data has to be ingested again
+        returns:
+            dict - the name of the ingestor and its private options
+        """
+        options = {name.lstrip('_'): repr(value) for name, value in sorted(vars(self).items()) if name.startswith('_')}
+        return {'ingestor': type(self).__name__, **options}
+
     @abstractmethod
     def ingest(self, file_path: str):
         """
@@ -21,6 +274,8 @@ class DataIngestor(ABC):
 
 # we will create a zip file ingestor to extract data from zip files
 class ZipfileDataIngestor(DataIngestor):
+    formats = ('zip',)
+
     def ingest(self, file_path: str):
         """
         we will extract all the files in the zip file into a folder called(extracted_data). after we will go throught the list of extrcted files and select our csv source of data and save it into the fo;der (raw_data)
@@ -53,41 +308,664 @@ class ZipfileDataIngestor(DataIngestor):
         df.to_csv(path, index=False)
 
 
+# we will stream the csv straight out of the zip file into the raw data without extracting it
+class StreamingZipDataIngestor(DataIngestor):
+    formats = ('zip',)
+
+    def __init__(self, member: str=None, schema: dict=HOUSING_SCHEMA, output_path: str=RAW_DATA_PATH, chunksize: int=100000):
+        """
+        we will initialize the streaming ingestor
+        args:
+            member: str - the csv file inside the zip file to ingest, if none the zip file must contain exactly one csv file
+            schema: dict - the column types we will read the csv with
+            output_path: str - where we will write the raw data
+            chunksize: int - the number of rows we hold in memory at a time
+        returns:
+            none
+        """
+        self._member = member
+        self._schema = schema
+        self._output_path = output_path
+        self._chunksize = chunksize
+
+    def _select_member(self, zip_ref: zipfile.ZipFile):
+        """
+        we will pick the csv member we want to ingest from the zip file
+        args:
+            zip_ref: zipfile.ZipFile - the opened zip file
+        returns:
+            str - the name of the member
+        """
+        if self._member is not None:
+            if self._member not in zip_ref.namelist():
+                raise FileNotFoundError(f"there is no member called {self._member} in the zip file.")
+            return self._member
+
+        csv_files = [name for name in zip_ref.namelist() if name.endswith(".csv")]
+
+        if len(csv_files) == 0:
+            raise FileNotFoundError("There is no csv file (0 csv files).")
+        if len(csv_files) > 1:
+           raise ValueError(f"there are many csv files, select one with member: {csv_files}")
+        return csv_files[0]
+
+    def ingest(self, file_path: str):
+        """
+        we will read the csv member chunk by chunk from the zip file with our schema and write each chunk
+        into the raw data, so the data is read once and never extracted to disk
+        args:
+            file_path: str - this contains the file path we would be ingesting
+        returns:
+            none
+        """
+        os.makedirs(os.path.dirname(self._output_path), exist_ok=True)
+        # we write next to the output and swap at the end so a failed run keeps the old raw data
+        temp_path = self._output_path + ".tmp"
+
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            member = self._select_member(zip_ref)
+            with zip_ref.open(member) as stream:
+                chunks = pd.read_csv(stream, dtype=self._schema, chunksize=self._chunksize)
+                with open(temp_path, 'w', newline='') as output:
+                    for i, chunk in enumerate(chunks):
+                        chunk.to_csv(output, index=False, header=(i == 0))
+
+        os.replace(temp_path, self._output_path)
+
+
+# we will read csv data (in a zip file or not) in fixed size chunks with the compact schema and append every chunk
+# to a parquet file, so data larger than the memory can be ingested
+class ChunkedDataIngestor(StreamingZipDataIngestor):
+    formats = ('zip', 'csv')
+
+    def __init__(self, member: str=None, schema: dict=COMPACT_HOUSING_SCHEMA, output_path: str=RAW_PARQUET_PATH, chunksize: int=100000, trace_memory: bool=False):
+        """
+        we will initialize the chunked ingestor
+        args:
+            member: str - the csv file inside the zip file to ingest, if none the zip file must contain exactly one csv file
+            schema: dict - the compact column types every chunk is cast to
+            output_path: str - the parquet file we will write the raw data to
+            chunksize: int - the number of rows we hold in memory at a time
+            trace_memory: bool - also measure the peak allocation of every chunk with tracemalloc, which slows every
+                                 allocation of the ingestion down
+        returns:
+            none
+        """
+        super().__init__(member=member, schema=schema, output_path=output_path, chunksize=chunksize)
+        # public, it does not change the output so it is not part of the cache config
+        self.trace_memory = trace_memory
+        # the rows, size in memory and (when traced) peak allocation of every chunk of the last run
+        self.chunk_reports = []
+
+    def _write_chunks(self, stream, temp_path: str):
+        """
+        we will cast every chunk of the stream to the schema and append it to the parquet file
+        args:
+            stream: file - the csv data, compressed csv files are decompressed by pandas
+            temp_path: str - the file we write to
+        returns:
+            none
+        """
+        chunks = pd.read_csv(stream, dtype=_csv_dtypes(self._schema), chunksize=self._chunksize,
+                             compression='infer' if isinstance(stream, str) else None)
+        writer = None
+        # we only start tracemalloc when asked to and leave a trace someone else started alone
+        tracing = tracemalloc.is_tracing()
+        trace = self.trace_memory and not tracing
+        if trace:
+            tracemalloc.start()
+        try:
+            while True:
+                if self.trace_memory:
+                    tracemalloc.reset_peak()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                chunk = apply_schema(chunk, self._schema)
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_path, table.schema, compression='zstd')
+                writer.write_table(table)
+
+                report = {
+                    'chunk': len(self.chunk_reports),
+                    'rows': len(chunk),
+                    'memory_bytes': int(chunk.memory_usage(deep=True).sum()),
+                }
+                report['bytes_per_row'] = round(report['memory_bytes'] / max(1, report['rows']), 2)
+                message = f"chunk {report['chunk']}: {report['rows']} rows, {report['memory_bytes']} bytes " \
+                          f"({report['bytes_per_row']} per row)"
+                if self.trace_memory:
+                    report['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                    message += f", peak {report['peak_bytes']} bytes"
+                self.chunk_reports.append(report)
+                logging.info(message)
+        finally:
+            if trace:
+                tracemalloc.stop()
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            raise ValueError("there are no rows to ingest.")
+
+    def ingest(self, file_path: str):
+        """
+        we will read the csv chunk by chunk and write every chunk with the compact schema into the parquet raw data
+        args:
+            file_path: str - a zip file holding the csv or a (gzip or zstd compressed) csv file
+        returns:
+            none
+        """
+        os.makedirs(os.path.dirname(self._output_path), exist_ok=True)
+        temp_path = self._output_path + ".tmp"
+        self.chunk_reports = []
+
+        if detect_format(file_path) == 'zip':
+            with zipfile.ZipFile(file_path, 'r') as zip_ref:
+                with zip_ref.open(self._select_member(zip_ref)) as stream:
+                    self._write_chunks(stream, temp_path)
+        else:
+            self._write_chunks(file_path, temp_path)
+
+        os.replace(temp_path, self._output_path)
+
+
+# this is the base for the formats pyarrow reads, the data is streamed batch by batch into the raw data
+class ArrowDataIngestor(DataIngestor):
+    def __init__(self, schema: dict=HOUSING_SCHEMA, output_path: str=RAW_DATA_PATH):
+        """
+        we will initialize the arrow ingestor
+        args:
+            schema: dict - the column types of the raw data, none keeps the types of the source
+            output_path: str - where we will write the raw data
+        returns:
+            none
+        """
+        self._schema = schema
+        self._output_path = output_path
+
+    def _arrow_schema(self):
+        """
+        we will turn our pandas schema into an arrow schema
+        returns:
+            pa.Schema - the arrow schema or none when no schema was given
+        """
+        if self._schema is None:
+            return None
+        return pa.schema([(column, ARROW_TYPES[dtype]) for column, dtype in self._schema.items()])
+
+    @abstractmethod
+    def _file_format(self, file_path: str):
+        """
+        we will return the pyarrow dataset format used to read the file
+        """
+        pass
+
+    def _writer(self, path: str, schema: pa.Schema):
+        """
+        we will open a writer in the format of the output file, so parquet and ipc sources are not turned back into csv
+        args:
+            path: str - the file we write (the temp file of the output)
+            schema: pa.Schema - the schema of the batches
+        returns:
+            a pyarrow writer with write_batch and close
+        """
+        output_format = EXTENSIONS.get(os.path.splitext(self._output_path)[1].lower(), 'csv')
+        if output_format == 'parquet':
+            return pq.ParquetWriter(path, schema, compression='zstd')
+        if output_format == 'ipc':
+            return pa.ipc.new_file(path, schema)
+        return pa_csv.CSVWriter(path, schema, write_options=pa_csv.WriteOptions(quoting_style='needed'))
+
+    def _dataset(self, file_path: str):
+        """
+        we will open the file (or directory) as a pyarrow dataset
+        args:
+            file_path: str - this contains the file path we would be ingesting
+        returns:
+            ds.Dataset - the dataset to scan
+        """
+        return ds.dataset(file_path, format=self._file_format(file_path))
+
+    def ingest(self, file_path: str):
+        """
+        we will scan the dataset with pyarrow's multithreaded reader and write the batches into the raw data as they arrive,
+        in the format of the output path (parquet for .parquet, arrow ipc for .feather/.arrow, csv otherwise)
+        args:
+            file_path: str - this contains the file path we would be ingesting
+        returns:
+            none
+        """
+        dataset = self._dataset(file_path)
+        schema = self._arrow_schema()
+        columns = schema.names if schema is not None else None
+        scanner = dataset.scanner(columns=columns, use_threads=True)
+
+        os.makedirs(os.path.dirname(self._output_path), exist_ok=True)
+        temp_path = self._output_path + ".tmp"
+        with self._writer(temp_path, schema or scanner.projected_schema) as writer:
+            for batch in scanner.to_batches():
+                writer.write_batch(batch.cast(schema) if schema is not None else batch)
+
+        os.replace(temp_path, self._output_path)
+
+
+class ParquetDataIngestor(ArrowDataIngestor):
+    formats = ('parquet',)
+
+    def _file_format(self, file_path: str):
+        return 'parquet'
+
+
+class ArrowIpcDataIngestor(ArrowDataIngestor):
+    # feather v2 files are arrow ipc files
+    formats = ('ipc',)
+
+    def _file_format(self, file_path: str):
+        return 'ipc'
+
+
+class CompressedCsvDataIngestor(ArrowDataIngestor):
+    # plain, gzip and zstd csv files, pyarrow picks the decompression from the extension
+    formats = ('csv',)
+
+    def _file_format(self, file_path: str):
+        schema = self._arrow_schema()
+        column_types = dict(zip(schema.names, schema.types)) if schema is not None else None
+        return ds.CsvFileFormat(convert_options=pa_csv.ConvertOptions(column_types=column_types))
+
+
+class ShardedDirectoryDataIngestor(ArrowDataIngestor):
+    # a directory of shards in one format, the shards are read in parallel
+    formats = ('directory',)
+
+    def _file_format(self, file_path: str):
+        shards = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(file_path)
+            for name in names if not name.startswith(('.', '_'))
+        )
+        if len(shards) == 0:
+            raise FileNotFoundError(f"there are no shards in {file_path}.")
+
+        shard_formats = {detect_format(shard) for shard in shards}
+        if len(shard_formats) > 1:
+            raise ValueError(f"the shards mix several formats: {sorted(shard_formats)}")
+
+        shard_format = shard_formats.pop()
+        if shard_format == 'csv':
+            return CompressedCsvDataIngestor(schema=self._schema)._file_format(file_path)
+        if shard_format in ('parquet', 'ipc'):
+            return shard_format
+        raise ValueError(f"shards in the {shard_format} format can not be read as a dataset.")
+
+    def _dataset(self, file_path: str):
+        # hidden and metadata files (like _SUCCESS) are not shards
+        return ds.dataset(file_path, format=self._file_format(file_path), exclude_invalid_files=False,
+                          ignore_prefixes=['.', '_'])
+
+
+def _read_watermarks(store_dir: str):
+    """
+    we will read the log of the deltas ingested into the raw store
+    args:
+        store_dir: str - the raw store
+    returns:
+        list - one dict per delta, oldest first
+    """
+    try:
+        with open(os.path.join(store_dir, WATERMARKS_FILE)) as log:
+            return json.load(log)
+    except FileNotFoundError:
+        return []
+
+
+def _write_watermarks(store_dir: str, watermarks: list):
+    path = os.path.join(store_dir, WATERMARKS_FILE)
+    with open(path + ".tmp", 'w') as log:
+        json.dump(watermarks, log, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _partition_dir(store_dir: str, watermark: int):
+    return os.path.join(store_dir, f"watermark={watermark:08d}")
+
+
+def _store_dataset(store_dir: str, watermarks: list):
+    """
+    we will open the partitions of the logged deltas as one dataset, a partition of an interrupted run is left out
+    """
+    files = [os.path.join(_partition_dir(store_dir, entry['watermark']), 'part-0.parquet')
+             for entry in watermarks if entry['rows_added'] > 0]
+    if len(files) == 0:
+        return None
+    return ds.dataset(files, format='parquet', partition_base_dir=store_dir,
+                      partitioning=ds.partitioning(pa.schema([('watermark', pa.int64())]), flavor='hive'))
+
+
+def latest_watermark(store_dir: str=RAW_STORE_DIR):
+    """
+    we will return the watermark of the last delta in the raw store
+    args:
+        store_dir: str - the raw store
+    returns:
+        int - the last watermark, 0 when the store is empty
+    """
+    watermarks = _read_watermarks(store_dir)
+    return watermarks[-1]['watermark'] if watermarks else 0
+
+
+def read_raw_store(store_dir: str=RAW_STORE_DIR, since_watermark: int=None, schema: dict=COMPACT_HOUSING_SCHEMA):
+    """
+    we will read the rows of the raw store, only the partitions after since_watermark are opened
+    args:
+        store_dir: str - the raw store
+        since_watermark: int - only rows of the deltas after this watermark, none reads every row
+        schema: dict - the column types we want
+    returns:
+        pd.Dataframe - the rows in the order they were ingested
+    """
+    dataset = _store_dataset(store_dir, _read_watermarks(store_dir))
+    if dataset is None:
+        return apply_schema(pd.DataFrame(columns=list(schema)), schema)
+
+    condition = ds.field('watermark') > since_watermark if since_watermark is not None else None
+    table = dataset.to_table(columns=list(schema), filter=condition)
+    return apply_schema(table.to_pandas(), schema)
+
+
+# we will append daily deltas to a raw store partitioned by watermark, rows whose key is already stored are dropped
+# and a delta that was already ingested is skipped, so running again is harmless
+class IncrementalDataIngestor(StreamingZipDataIngestor):
+    formats = ('zip', 'csv', 'parquet')
+    cacheable = False
+
+    def __init__(self, key: list=None, member: str=None, schema: dict=COMPACT_HOUSING_SCHEMA, store_dir: str=RAW_STORE_DIR):
+        """
+        we will initialize the incremental ingestor
+        args:
+            key: list - the columns that identify a listing, if none the whole row is the key
+            member: str - the csv file inside the zip file to ingest, if none the zip file must contain exactly one csv file
+            schema: dict - the compact column types of the store
+            store_dir: str - the directory of the raw store
+        returns:
+            none
+        """
+        super().__init__(member=member, schema=schema, output_path=store_dir)
+        self._key = list(key) if key is not None else list(schema)
+        self._store_dir = store_dir
+        # the log entry of the last delta, or none when it was already ingested
+        self.last_delta = None
+
+    def _read_delta(self, file_path: str):
+        """
+        we will read the delta with the compact schema
+        args:
+            file_path: str - a zip file holding a csv, a (compressed) csv or a parquet file
+        returns:
+            pd.Dataframe - the rows of the delta
+        """
+        if detect_format(file_path) == 'zip':
+            with zipfile.ZipFile(file_path, 'r') as zip_ref:
+                with zip_ref.open(self._select_member(zip_ref)) as stream:
+                    return apply_schema(pd.read_csv(stream, dtype=_csv_dtypes(self._schema)), self._schema)
+        return read_raw_data(file_path, schema=self._schema)
+
+    def _row_keys(self, df: pd.DataFrame):
+        """
+        we will hash the key columns of every row into one number
+        """
+        return pd.util.hash_pandas_object(df[self._key], index=False).to_numpy()
+
+    def ingest(self, file_path: str):
+        """
+        we will append the new rows of the delta to the raw store under the next watermark
+        args:
+            file_path: str - the delta we would be ingesting
+        returns:
+            none
+        """
+        os.makedirs(self._store_dir, exist_ok=True)
+        watermarks = _read_watermarks(self._store_dir)
+        source_hash = content_hash(file_path)
+
+        if any(entry['source_hash'] == source_hash for entry in watermarks):
+            logging.info(f"{file_path} was already ingested into {self._store_dir}, skipping it.")
+            self.last_delta = None
+            return
+
+        watermark = watermarks[-1]['watermark'] + 1 if watermarks else 1
+        delta = self._read_delta(file_path)
+        keys = self._row_keys(delta)
+
+        # a row is new when its key is not in the store and not earlier in the delta
+        new = ~pd.Series(keys).duplicated().to_numpy()
+        dataset = _store_dataset(self._store_dir, watermarks)
+        if dataset is not None:
+            stored = dataset.to_table(columns=['_key']).column('_key').to_numpy()
+            new &= ~numpy.isin(keys, stored)
+        rows = delta[new].reset_index(drop=True)
+
+        # a partition left by an interrupted run has this watermark too, it is replaced
+        partition = _partition_dir(self._store_dir, watermark)
+        os.makedirs(partition, exist_ok=True)
+        for leftover in os.listdir(partition):
+            os.remove(os.path.join(partition, leftover))
+        if len(rows) > 0:
+            table = pa.Table.from_pandas(rows.assign(_key=keys[new]), preserve_index=False)
+            path = os.path.join(partition, 'part-0.parquet')
+            pq.write_table(table, path + ".tmp", compression='zstd')
+            os.replace(path + ".tmp", path)
+
+        self.last_delta = {
+            'watermark': watermark,
+            'source': os.path.abspath(file_path),
+            'source_hash': source_hash,
+            'rows_read': len(delta),
+            'rows_added': len(rows),
+            'ingested_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        _write_watermarks(self._store_dir, watermarks + [self.last_delta])
+        logging.info(f"watermark {watermark}: {len(rows)} of {len(delta)} rows of {file_path} are new.")
+
+
+# the ingestor we use for every format when none is set
+INGESTORS = {
+    'zip': StreamingZipDataIngestor,
+    'parquet': ParquetDataIngestor,
+    'ipc': ArrowIpcDataIngestor,
+    'csv': CompressedCsvDataIngestor,
+    'directory': ShardedDirectoryDataIngestor,
+}
+
+
+def _files_of(path: str):
+    """
+    we will list the files of a source, a directory of shards gives all its files in a fixed order
+    args:
+        path: str - a file or directory
+    returns:
+        list - the file paths
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+
+
+def _stat_signature(path: str):
+    """
+    we will take the size and modification time of every file, it is cheap and tells us if a file could have changed
+    args:
+        path: str - a file or directory
+    returns:
+        list - [file, size, mtime_ns] of every file
+    """
+    signature = []
+    for file in _files_of(path):
+        stat = os.stat(file)
+        signature.append([os.path.relpath(file, path) if file != path else os.path.basename(file), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def content_hash(path: str, block_size: int=1 << 20):
+    """
+    we will hash the content of a file (or of all the files of a directory with their names)
+    args:
+        path: str - a file or directory
+        block_size: int - the number of bytes we read at a time
+    returns:
+        str - the sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    for file in _files_of(path):
+        if file != path:
+            digest.update(os.path.relpath(file, path).encode())
+        with open(file, 'rb') as data:
+            for block in iter(lambda: data.read(block_size), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+# we keep the hash of every source we ingested and of the output it produced, so an unchanged source is not ingested again
+class IngestionManifest():
+    def __init__(self, path: str=MANIFEST_PATH):
+        """
+        we will initialize the manifest
+        args:
+            path: str - the json file of the manifest
+        returns:
+            none
+        """
+        self._path = path
+
+    def _load(self):
+        try:
+            with open(self._path) as manifest:
+                return json.load(manifest)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, entries: dict):
+        os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+        with open(self._path + ".tmp", 'w') as manifest:
+            json.dump(entries, manifest, indent=2, sort_keys=True)
+        os.replace(self._path + ".tmp", self._path)
+
+    def is_fresh(self, source: str, output: str, config: dict):
+        """
+        we will check if the output was produced from this source with this config. when the sizes and modification
+        times still match we trust them, otherwise we compare the content hashes
+        args:
+            source: str - the file or directory we want to ingest
+            output: str - the raw data the ingestor writes
+            config: dict - the cache config of the ingestor
+        returns:
+            bool - true when ingesting again would produce the same output
+        """
+        entries = self._load()
+        entry = entries.get(os.path.abspath(output))
+        if entry is None or entry['source'] != os.path.abspath(source) or entry['config'] != config:
+            return False
+        if not os.path.exists(output) or not os.path.exists(source):
+            return False
+
+        source_stat, output_stat = _stat_signature(source), _stat_signature(output)
+        if entry['source_stat'] == source_stat and entry['output_stat'] == output_stat:
+            return True
+
+        if content_hash(source) != entry['source_hash'] or content_hash(output) != entry['output_hash']:
+            return False
+
+        # the files were touched (for example checked out again) but not changed, remember the new times
+        entry['source_stat'], entry['output_stat'] = source_stat, output_stat
+        entries[os.path.abspath(output)] = entry
+        self._save(entries)
+        return True
+
+    def record(self, source: str, output: str, config: dict):
+        """
+        we will remember the hashes of the source and of the output it produced
+        args:
+            source: str - the file or directory we ingested
+            output: str - the raw data the ingestor wrote
+            config: dict - the cache config of the ingestor
+        returns:
+            none
+        """
+        entries = self._load()
+        entries[os.path.abspath(output)] = {
+            'source': os.path.abspath(source),
+            'source_hash': content_hash(source),
+            'source_stat': _stat_signature(source),
+            'output_hash': content_hash(output),
+            'output_stat': _stat_signature(output),
+            'config': config,
+            'ingested_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        self._save(entries)
+
+
 # create our ingestor selector
 class SelectDataIngestor():
-    def __init__(self, ingestor: DataIngestor=DataIngestor):
+    def __init__(self, ingestor: DataIngestor=DataIngestor, manifest: IngestionManifest=None):
         """
         we will set a default ingestor with the base ingestor (DataIngestor)
         args:
             ingestor: DataIngestor - stores the base ingestor(DataIngestor)
+            manifest: IngestionManifest - the manifest used to skip unchanged sources, none disables the cache
         returns:
             none - we will set the default ingestor to be DataIngestor
         """
         self._ingestor = ingestor
+        self._manifest = manifest if manifest is not None else IngestionManifest()
+        # true when the last execute_ingestor call found the output up to date
+        self.cache_hit = False
         
-    def set_ingestor(self, ingestor: DataIngestor):
+    def set_ingestor(self, ingestor: DataIngestor, **kwargs):
         """
         we will set our preferred ingestor
         args:
             ingestor: DataIngestor - stores our preferred ingestor
+            kwargs - the options of the ingestor (for example member for StreamingZipDataIngestor)
         returns:
             none - we will set the ingestor to our preferred ingestor
         """
-        self._ingestor = ingestor()
+        self._ingestor = ingestor(**kwargs)
 
-    def execute_ingestor(self,file_path_: str):
+    def execute_ingestor(self,file_path_: str, use_cache: bool=True):
         """
-        we will validate the extension of the file path to be (.zip) and then clll the righ ingestor
+        we will detect the format of the file path (extension or magic bytes) and call the right ingestor.
+        when no ingestor was set we pick one from INGESTORS, otherwise we validate the format against the set ingestor.
+        when the manifest shows the source and the ingestor are unchanged and the output is intact nothing is done
         args:
-            file_path: str - this contains the file path of the zip file we want t ingest its contents
+            file_path: str - this contains the file path (or directory of shards) we want to ingest
+            use_cache: bool - false ingests even when the output is up to date
         returns:
-            none - after validating we will call the righ ingestor with respect to the file extensio of our data source
+            none - after validating we will call the righ ingestor with respect to the format of our data source
         """
-        file_path_extension = os.path.splitext(file_path_)[1]
-        if file_path_extension == ".zip":
-            return self._ingestor.ingest(file_path_)
-        else:
-            raise ValueError("The file path does not contain a zip file.")
+        self.cache_hit = False
+        file_format = detect_format(file_path_)
+
+        if not isinstance(self._ingestor, DataIngestor):
+            if file_format not in INGESTORS:
+                raise ValueError(f"there is no ingestor for the {file_format} format.")
+            self._ingestor = INGESTORS[file_format]()
+
+        if file_format not in self._ingestor.formats:
+            raise ValueError(f"The file path does not contain a {' or '.join(self._ingestor.formats)} file.")
+
+        output_path = self._ingestor._output_path
+        config = self._ingestor.cache_config()
+        use_cache = use_cache and self._ingestor.cacheable
+        if use_cache and self._manifest.is_fresh(file_path_, output_path, config):
+            self.cache_hit = True
+            logging.info(f"cache hit: {output_path} is up to date with {file_path_}, skipping ingestion.")
+            return
+
+        self._ingestor.ingest(file_path_)
+        if self._ingestor.cacheable:
+            self._manifest.record(file_path_, output_path, config)
         
 
 
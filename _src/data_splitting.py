@@ -1,10 +1,289 @@
 import os
 import sys
+import json
 import numpy
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
 from abc import ABC, abstractmethod
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, RepeatedKFold, RepeatedStratifiedKFold
 from typing import Tuple
+from _src.data_ingestion import RAW_DATA_PATH, COMPACT_HOUSING_SCHEMA, read_raw_rows, detect_format, content_hash, _stat_signature
+
+# where the splitters leave the train and test sets
+SPLIT_DIR = "data/splitted_data/"
+
+# the files of a split
+SPLIT_NAMES = ('x_train', 'x_test', 'y_train', 'y_test')
+
+# the file of an index only split, it holds the row positions of the sets and the config of the split
+INDEX_FILE = "split_indices.npz"
+
+# the fold assignment of the train set shared by every model and search
+FOLDS_FILE = "folds.npz"
+
+# the file extension of every split format, in the order read_split looks for them
+SPLIT_FORMATS = {
+    'feather': '.feather',
+    'parquet': '.parquet',
+    'csv': '.csv',
+}
+
+
+def write_split(df: pd.DataFrame, name: str, output_format: str='feather', path: str=SPLIT_DIR):
+    """
+    we will write one of the sets in a typed binary format (or csv), the dtypes are kept by feather and parquet
+    args:
+        df: pd.Dataframe - the set we want to write, a series is written as a one column frame
+        name: str - the name of the set (x_train, x_test, y_train or y_test)
+        output_format: str - feather (uncompressed so it can be memory mapped), parquet or csv
+        path: str - the folder of the split
+    returns:
+        str - the path of the written file
+    """
+    if output_format not in SPLIT_FORMATS:
+        raise ValueError(f"the split format {output_format} is not one of {list(SPLIT_FORMATS)}.")
+
+    os.makedirs(path, exist_ok=True)
+    file_path = os.path.join(path, name + SPLIT_FORMATS[output_format])
+    df = pd.DataFrame(df).reset_index(drop=True)
+
+    # a binary file of another format would be read before this one, csv files are looked at last and can stay
+    for other_format, extension in SPLIT_FORMATS.items():
+        other_path = os.path.join(path, name + extension)
+        if other_format not in (output_format, 'csv') and os.path.exists(other_path):
+            os.remove(other_path)
+
+    # we write next to the file and swap at the end so readers never see half a file
+    temp_path = file_path + ".tmp"
+    if output_format == 'feather':
+        feather.write_feather(df, temp_path, compression='uncompressed')
+    elif output_format == 'parquet':
+        df.to_parquet(temp_path, index=False)
+    else:
+        df.to_csv(temp_path, index=False)
+    os.replace(temp_path, file_path)
+    return file_path
+
+
+def _find_split(name: str, path: str=SPLIT_DIR):
+    """
+    we will find the file a set is read from, materialized binary files come first, then an index split, then csv
+    args:
+        name: str - the name of the set (x_train, x_test, y_train or y_test)
+        path: str - the folder of the split
+    returns:
+        str - the format (feather, parquet, index or csv)
+        str - the file of the set (the index file for an index split)
+    """
+    for output_format, extension in SPLIT_FORMATS.items():
+        file_path = os.path.join(path, name + extension)
+        if output_format == 'csv' and os.path.exists(os.path.join(path, INDEX_FILE)):
+            return 'index', os.path.join(path, INDEX_FILE)
+        if os.path.exists(file_path):
+            return output_format, file_path
+
+    raise FileNotFoundError(f"there is no {name} set in {path}.")
+
+
+def read_split(name: str, path: str=SPLIT_DIR, columns: list=None):
+    """
+    we will read one of the sets, feather files are memory mapped instead of copied into memory
+    args:
+        name: str - the name of the set (x_train, x_test, y_train or y_test)
+        path: str - the folder of the split
+        columns: list - only read these columns, none reads all of them
+    returns:
+        pd.Dataframe - the set with the dtypes it was written with
+    """
+    output_format, file_path = _find_split(name, path)
+    if output_format == 'index':
+        return read_index_split(name, path=path, columns=columns)
+    if output_format == 'feather':
+        return feather.read_feather(file_path, columns=columns, memory_map=True)
+    if output_format == 'parquet':
+        return pd.read_parquet(file_path, columns=columns)
+    return pd.read_csv(file_path, usecols=columns)
+
+
+def iter_split_chunks(name: str, chunksize: int=100000, path: str=SPLIT_DIR, columns: list=None):
+    """
+    we will read one of the sets chunk by chunk, so it never has to fit in memory
+    args:
+        name: str - the name of the set (x_train, x_test, y_train or y_test)
+        chunksize: int - the number of rows of a chunk
+        path: str - the folder of the split
+        columns: list - only read these columns, none reads all of them
+    returns:
+        iterator - the chunks as dataframes, in the order of the set
+    """
+    output_format, file_path = _find_split(name, path)
+    if output_format == 'index':
+        train, test, config = load_split_indices(path)
+        _check_index_source(config)
+        rows = train if name.endswith('train') else test
+        if columns is None:
+            target = config['target_var']
+            columns = [target] if name.startswith('y') else [column for column in config['columns'] if column != target]
+        if detect_format(config['source']) not in ('directory', 'parquet'):
+            # a csv file can only be parsed whole, it is parsed once instead of once per chunk
+            frame = read_raw_rows(config['source'], rows, columns=columns)
+            for start in range(0, len(frame), chunksize):
+                yield frame.iloc[start:start + chunksize].reset_index(drop=True)
+            return
+        for start in range(0, len(rows), chunksize):
+            yield read_raw_rows(config['source'], rows[start:start + chunksize], columns=columns)
+    elif output_format == 'feather':
+        table = feather.read_table(file_path, columns=columns, memory_map=True)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+    elif output_format == 'parquet':
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(file_path, usecols=columns, chunksize=chunksize)
+
+
+def load_split_indices(path: str=SPLIT_DIR):
+    """
+    we will load the row positions and the config of an index only split
+    args:
+        path: str - the folder of the split
+    returns:
+        numpy.array - the train row positions (int32)
+        numpy.array - the test row positions (int32)
+        dict - the config of the split (source, seed, test_size, ...)
+    """
+    with numpy.load(os.path.join(path, INDEX_FILE)) as data:
+        return data['train'], data['test'], json.loads(str(data['config']))
+
+
+def _check_index_source(config: dict):
+    """
+    we will make sure the raw data is still the data the row positions were drawn from, the same positions of a changed
+    file are other rows. the sizes and times are compared first, the content is only hashed when they differ
+    args:
+        config: dict - the config of the index split
+    returns:
+        none
+    """
+    # index files written before the source was fingerprinted can not be checked
+    if 'source_hash' not in config:
+        return
+    source = config['source']
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"the raw data {source} of the index split is gone, split again.")
+    if _stat_signature(source) == config['source_stat']:
+        return
+    if content_hash(source) != config['source_hash']:
+        raise ValueError(f"{source} changed since its {config['rows']} rows were split, split again.")
+
+
+def read_index_split(name: str, path: str=SPLIT_DIR, columns: list=None):
+    """
+    we will read one of the sets of an index only split, only its rows are taken from the raw data
+    args:
+        name: str - the name of the set (x_train, x_test, y_train or y_test)
+        path: str - the folder of the split
+        columns: list - only read these columns, none reads all the columns of the set
+    returns:
+        pd.Dataframe - the set
+    """
+    if name not in SPLIT_NAMES:
+        raise ValueError(f"{name} is not one of {SPLIT_NAMES}.")
+
+    train, test, config = load_split_indices(path)
+    _check_index_source(config)
+    rows = train if name.endswith('train') else test
+    if columns is None:
+        target = config['target_var']
+        columns = [target] if name.startswith('y') else [column for column in config['columns'] if column != target]
+    return read_raw_rows(config['source'], rows, columns=columns)
+
+
+def _remove_index_split(path: str):
+    """
+    we will remove the index file of an earlier split so the written sets are the ones read
+    """
+    index_path = os.path.join(path, INDEX_FILE)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+
+
+def make_folds(y, n_splits: int=10, n_repeats: int=1, n_bins: int=None, random_state: int=42):
+    """
+    we will give every row of the train set a fold for every repeat, stratified on quantile bins of y if n_bins is set
+    args:
+        y: array - the target of the train set
+        n_splits: int - the number of folds
+        n_repeats: int - the number of times the rows are shuffled into folds
+        n_bins: int - the number of price quantile bins to stratify on, none for plain k fold
+        random_state: int - this will help us get a consitent result when ever we run the program
+    returns:
+        numpy.array - the fold of every row for every repeat (n_repeats x rows, int8)
+        dict - the config of the folds
+    """
+    y = numpy.asarray(y, dtype=float).ravel()
+    config = {'rows': len(y), 'n_splits': n_splits, 'n_repeats': n_repeats, 'n_bins': n_bins, 'random_state': random_state}
+
+    if n_bins is not None:
+        edges = numpy.quantile(y, numpy.linspace(0, 1, n_bins + 1)[1:-1])
+        labels = numpy.searchsorted(edges, y, side='right')
+        splitter = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+        config['bin_edges'] = edges.tolist()
+    else:
+        labels = numpy.zeros(len(y))
+        splitter = RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+
+    folds = numpy.empty((n_repeats, len(y)), dtype=numpy.int8)
+    for i, (_, test) in enumerate(splitter.split(numpy.zeros((len(y), 1)), labels)):
+        folds[i // n_splits, test] = i % n_splits
+    return folds, config
+
+
+def write_folds(y, path: str=SPLIT_DIR, **options):
+    """
+    we will make the folds of the train set (see make_folds for the options) and save them
+    args:
+        y: array - the target of the train set, in the order of the train set
+        path: str - the folder of the split
+    returns:
+        str - the path of the fold file
+    """
+    folds, config = make_folds(y, **options)
+    os.makedirs(path, exist_ok=True)
+    folds_path = os.path.join(path, FOLDS_FILE)
+    with open(folds_path + ".tmp", 'wb') as folds_file:
+        numpy.savez(folds_file, folds=folds, config=numpy.array(json.dumps(config)))
+    os.replace(folds_path + ".tmp", folds_path)
+    return folds_path
+
+
+def load_folds(path: str=SPLIT_DIR, n_rows: int=None):
+    """
+    we will load the saved folds as (train rows, validation rows) pairs, which every sklearn cv argument accepts
+    args:
+        path: str - the folder of the split
+        n_rows: int - the number of rows of the train set, checked against the folds when given
+    returns:
+        list - one (train, validation) pair of int32 row positions per fold and repeat
+    """
+    with numpy.load(os.path.join(path, FOLDS_FILE)) as data:
+        folds = data['folds']
+        config = json.loads(str(data['config']))
+
+    if n_rows is not None and n_rows != config['rows']:
+        raise ValueError(f"the folds were made for {config['rows']} rows but the train set has {n_rows}, split again.")
+
+    pairs = []
+    for repeat in folds:
+        for fold in range(config['n_splits']):
+            in_fold = repeat == fold
+            pairs.append((numpy.flatnonzero(~in_fold).astype(numpy.int32), numpy.flatnonzero(in_fold).astype(numpy.int32)))
+    return pairs
+
 
 # this the base class for the splitting the data into train test sets
 class SplittingDataset(ABC):
@@ -22,7 +301,7 @@ class SplittingDataset(ABC):
 
 # this is the slitter class
 class TestTrainSplit(SplittingDataset):
-    def __init__(self, test_size: float, random_state: int, target_var: str, shuffle: bool=True):
+    def __init__(self, test_size: float, random_state: int, target_var: str, shuffle: bool=True, output_format: str='feather', export_csv: bool=False):
         """
         we will initialize our slitter with some values like test_size, etc
         args:
@@ -30,6 +309,8 @@ class TestTrainSplit(SplittingDataset):
             random_state: int - this will help us get a consitent result when ever we run the program
             target_var: str - this will hold the target column name
             shuffle: bool - this will help shuffle our data before splitting
+            output_format: str - the format of the sets, feather, parquet or csv
+            export_csv: bool - also write the sets as csv files
         returns:
             None
         """
@@ -37,6 +318,8 @@ class TestTrainSplit(SplittingDataset):
         self._random_state = random_state
         self._target_var = target_var
         self._shuffle = shuffle
+        self._output_format = output_format
+        self._export_csv = export_csv
 
     def split(self, df: pd.DataFrame):
         """
@@ -51,29 +334,157 @@ class TestTrainSplit(SplittingDataset):
 
         x_train,x_test,y_train,y_test = train_test_split(x,y, test_size=self._test_size, random_state=self._random_state, shuffle=self._shuffle)
 
-        # save all the tests and train data into  folder(splitted_data)
-        path = "data/splitted_data/"
+        # save all the tests and trains into their respective files
+        _remove_index_split(SPLIT_DIR)
+        for name, data in zip(SPLIT_NAMES, (x_train, x_test, y_train, y_test)):
+            if self._export_csv and self._output_format != 'csv':
+                write_split(data, name, output_format='csv')
+            write_split(data, name, output_format=self._output_format)
 
-        # check if the path exist if not create it
-        os.makedirs(os.path.dirname(os.path.join(path,"x_train.csv")), exist_ok=True)
-        os.makedirs(os.path.dirname(os.path.join(path,"x_test.csv")), exist_ok=True)
-        os.makedirs(os.path.dirname(os.path.join(path,"y_train.csv")), exist_ok=True)
-        os.makedirs(os.path.dirname(os.path.join(path,"y_test.csv")), exist_ok=True)
 
-        x_train = pd.DataFrame(x_train)
-        x_test = pd.DataFrame(x_test)
-        y_train = pd.Series(y_train)
-        y_test = pd.Series(y_test)
+# this splitter only stores the row positions of the train and test sets, the sets are read from the raw data when needed
+class IndexSplit(SplittingDataset):
+    def __init__(self, test_size: float, random_state: int, target_var: str, shuffle: bool=True, source_path: str=RAW_DATA_PATH, path: str=SPLIT_DIR):
+        """
+        we will initialize our slitter with some values like test_size, etc
+        args:
+            test_size: float - this will determine the size of the test data set(multiply by 100 to gfet a percentage)
+            random_state: int - this will help us get a consitent result when ever we run the program
+            target_var: str - this will hold the target column name
+            shuffle: bool - this will help shuffle our data before splitting
+            source_path: str - the raw data the dataframe was read from, the sets are read from it
+            path: str - the folder of the split
+        returns:
+            None
+        """
+        self._test_size = test_size
+        self._random_state = random_state
+        self._target_var = target_var
+        self._shuffle = shuffle
+        self._source_path = source_path
+        self._path = path
+
+    def split(self, df: pd.DataFrame):
+        """
+        we will split the row positions the same way TestTrainSplit splits the rows and save them with the config
+        args:
+            df: pd.Dataframe - this will contain or dataframe, only its length and columns are used
+        returns:
+            none
+        """
+        if len(df) >= numpy.iinfo(numpy.int32).max:
+            raise ValueError("there are too many rows for int32 row positions.")
+
+        positions = numpy.arange(len(df), dtype=numpy.int32)
+        train, test = train_test_split(positions, test_size=self._test_size, random_state=self._random_state, shuffle=self._shuffle)
+
+        config = {
+            'source': self._source_path,
+            # the fingerprint of the source, the readers refuse the positions once it changed
+            'source_hash': content_hash(self._source_path),
+            'source_stat': _stat_signature(self._source_path),
+            'rows': len(df),
+            'columns': list(df.columns),
+            'target_var': self._target_var,
+            'test_size': self._test_size,
+            'random_state': self._random_state,
+            'shuffle': self._shuffle,
+        }
+
+        os.makedirs(self._path, exist_ok=True)
+        # materialized sets would be read before the index, they are stale now
+        for name in SPLIT_NAMES:
+            for output_format, extension in SPLIT_FORMATS.items():
+                if output_format != 'csv' and os.path.exists(os.path.join(self._path, name + extension)):
+                    os.remove(os.path.join(self._path, name + extension))
+
+        index_path = os.path.join(self._path, INDEX_FILE)
+        with open(index_path + ".tmp", 'wb') as index_file:
+            numpy.savez(index_file, train=train, test=test, config=numpy.array(json.dumps(config)))
+        os.replace(index_path + ".tmp", index_path)
+
+
+# this splitter puts every row in train or test from a hash of its key, so it needs one pass over a stream of chunks
+# and a row keeps its set when new data arrives
+class HashSplit(SplittingDataset):
+    def __init__(self, test_size: float, random_state: int, target_var: str, shuffle: bool=True, key: list=None, path: str=SPLIT_DIR):
+        """
+        we will initialize our slitter with some values like test_size, etc
+        args:
+            test_size: float - the share of the hash range that goes to the test set
+            random_state: int - the salt of the hash, another value gives another (stable) split
+            target_var: str - this will hold the target column name
+            shuffle: bool - not used, the hash already scatters the rows
+            key: list - the columns that identify a row, if none the whole row is hashed
+            path: str - the folder of the split
+        returns:
+            None
+        """
+        if not 0 < test_size < 1:
+            raise ValueError("test_size must be a share between 0 and 1 for the hash splitter.")
+        self._test_size = test_size
+        self._random_state = random_state
+        self._target_var = target_var
+        self._key = list(key) if key is not None else None
+        self._path = path
+
+    def assign(self, chunk: pd.DataFrame):
+        """
+        we will decide for every row of the chunk if it belongs to the test set. the decision only depends on the
+        key values of the row (with the types of the compact schema) and the salt
+        args:
+            chunk: pd.Dataframe - the rows
+        returns:
+            numpy.array - true for the rows of the test set
+        """
+        key = self._key if self._key is not None else list(chunk.columns)
+        # the hash key has to be 16 characters
+        salt = str(self._random_state).rjust(16, '0')[-16:]
+        hashes = pd.util.hash_pandas_object(chunk[key], index=False, hash_key=salt).to_numpy()
+        # the top 53 bits as a share of the hash range
+        return (hashes >> numpy.uint64(11)) * (1.0 / (1 << 53)) < self._test_size
+
+    def split(self, df):
+        """
+        we will stream the chunks into parquet train and test sets
+        args:
+            df: pd.Dataframe - a dataframe, or an iterable of dataframe chunks (see iter_raw_chunks)
+        returns:
+            none
+        """
+        chunks = [df] if isinstance(df, pd.DataFrame) else df
+
+        os.makedirs(self._path, exist_ok=True)
+        writers = {}
+        try:
+            for chunk in chunks:
+                is_test = self.assign(chunk)
+                x = chunk.drop(columns=[self._target_var])
+                y = chunk[[self._target_var]]
+                sets = {'x_train': x[~is_test], 'x_test': x[is_test], 'y_train': y[~is_test], 'y_test': y[is_test]}
+                for name, data in sets.items():
+                    table = pa.Table.from_pandas(data, preserve_index=False)
+                    if name not in writers:
+                        writers[name] = pq.ParquetWriter(os.path.join(self._path, name + ".parquet.tmp"), table.schema)
+                    writers[name].write_table(table)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        if len(writers) == 0:
+            raise ValueError("there are no rows to split.")
+
+        # the sets of earlier splits would be read before these ones
+        _remove_index_split(self._path)
+        for name in SPLIT_NAMES:
+            feather_path = os.path.join(self._path, name + SPLIT_FORMATS['feather'])
+            if os.path.exists(feather_path):
+                os.remove(feather_path)
+            os.replace(os.path.join(self._path, name + ".parquet.tmp"), os.path.join(self._path, name + ".parquet"))
 
-        # save all the tests and trins into their respective files
-        x_train.to_csv(path + 'x_train.csv', index=False)
-        x_test.to_csv(path + 'x_test.csv', index=False)
-        y_train.to_csv(path + 'y_train.csv', index=False)
-        y_test.to_csv(path + 'y_test.csv', index=False)
 
-    
 class SelectSplitter():
-    def __init__(self, test_size: float, random_state: int, target_var: str, shuffle: bool=True):
+    def __init__(self, test_size: float, random_state: int, target_var: str, shuffle: bool=True, **options):
         """
         we will initialize our slitter with some values like test_size, etc
         args:
@@ -81,6 +492,7 @@ class SelectSplitter():
             random_state: int - this will help us get a consitent result when ever we run the program
             target_var: str - this will hold the target column name
             shuffle: bool - this will help shuffle our data before splitting
+            options - the other options of the splitter (for example output_format and export_csv for TestTrainSplit)
         returns:
             None
         """
@@ -88,12 +500,17 @@ class SelectSplitter():
         self._random_state = random_state
         self._target_var = target_var
         self._shuffle = shuffle
+        self._options = options
 
-    def set_splitter(self, splitter: SplittingDataset=SplittingDataset):
+    def set_splitter(self, splitter: SplittingDataset=SplittingDataset, **kwargs):
         """
         we will change the slitter from the default one to our prefered splitter
+        args:
+            splitter: SplittingDataset - our preferred splitter
+            kwargs - the options of the splitter (for example source_path for IndexSplit)
         """
         self._splitter = splitter
+        self._options = {**self._options, **kwargs}
 
     def execute_splitter(self, df: pd.DataFrame):
         """
@@ -103,7 +520,7 @@ class SelectSplitter():
         returns:
             none
         """
-        self._splitter = self._splitter(test_size=self._test_size, random_state=self._random_state, shuffle=self._shuffle, target_var=self._target_var)
+        self._splitter = self._splitter(test_size=self._test_size, random_state=self._random_state, shuffle=self._shuffle, target_var=self._target_var, **self._options)
         self._splitter.split(df)
     
 
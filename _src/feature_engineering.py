@@ -1,16 +1,283 @@
 import os
 import sys
+import json
+import shutil
+import hashlib
 import numpy
 import pandas as pd
 from abc import ABC, abstractmethod
 
+import sklearn
 from sklearn.preprocessing import OneHotEncoder, PowerTransformer, StandardScaler, RobustScaler, FunctionTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
+from _src.categorical_encoding import DictionaryEncoder, FLAG_VOCABULARY, FLAG_ALIASES
+from _src.streaming_statistics import QuantileSketch, YeoJohnsonGrid
 import joblib
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# where the feature engineering leaves the arrays
+ARRAY_DIR = "data/arr_data/"
+
+# where the fitted preprocessors and their arrays are kept by the hash of their inputs and config
+FEATURE_CACHE_DIR = "data/feature_cache/"
+
+# where the files of a cache entry are put, by file name. the fitted preprocessors stay next to the arrays they
+# produced, the serving copies in the root are only replaced together with the model (see model_evaluation)
+X_OUTPUTS = {'x_train.npy': ARRAY_DIR + 'x_train.npy', 'x_test.npy': ARRAY_DIR + 'x_test.npy', 'preprocessor.pkl': ARRAY_DIR + 'preprocessor.pkl'}
+Y_OUTPUTS = {'y_train.npy': ARRAY_DIR + 'y_train.npy', 'y_test.npy': ARRAY_DIR + 'y_test.npy', 'target_preprocessor.pkl': ARRAY_DIR + 'target_preprocessor.pkl'}
+
+
+def save_array(array, path: str):
+    """
+    we will write the array as a real .npy file, which numpy.load can memory map
+    args:
+        array: numpy.array - the array to write
+        path: str - the .npy file
+    returns:
+        none
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # we write next to the file and swap at the end so readers never see half an array
+    with open(path + ".tmp", 'wb') as array_file:
+        numpy.save(array_file, array)
+    os.replace(path + ".tmp", path)
+
+
+def load_array(path: str, mmap_mode: str='r'):
+    """
+    we will memory map a .npy file, arrays pickled by joblib under a .npy name (written by older versions) are loaded whole
+    args:
+        path: str - the .npy file
+        mmap_mode: str - the numpy memory map mode, none reads the array into memory
+    returns:
+        numpy.array - the array
+    """
+    try:
+        return numpy.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+    except ValueError:
+        return joblib.load(path)
+
+
+def data_hash(data):
+    """
+    we will hash the content of a set, its column names and dtypes. the rows are hashed one by one, so a set read in
+    chunks has the same hash whatever the chunk size
+    args:
+        data - a dataframe, a function returning an iterator of dataframe chunks, or none
+    returns:
+        str - the sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    if data is None:
+        digest.update(b'none')
+        return digest.hexdigest()
+
+    chunks = data() if callable(data) else [data]
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            digest.update(json.dumps([[str(column) for column in chunk.columns], [str(dtype) for dtype in chunk.dtypes]]).encode())
+        digest.update(pd.util.hash_pandas_object(chunk, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def transformer_config(estimator):
+    """
+    we will describe an unfitted transformer by its class and the params of every transformer inside it, n_jobs is
+    left out because it does not change the result
+    args:
+        estimator - the unfitted sklearn transformer (a ColumnTransformer or a Pipeline)
+    returns:
+        dict - the class and params
+    """
+    params = {}
+    for name, value in sorted(estimator.get_params(deep=True).items()):
+        if name.split('__')[-1] == 'n_jobs':
+            continue
+        # an estimator is described by its class, its params have their own keys
+        params[name] = f"{type(value).__module__}.{type(value).__qualname__}" if hasattr(value, 'get_params') else repr(value)
+    return {'class': f"{type(estimator).__module__}.{type(estimator).__qualname__}", 'params': params}
+
+
+# we keep every fitted preprocessor with the arrays it produced under the hash of the input sets and the config, so a
+# repeated run with the same inputs only has to put the stored files back in place
+class FeatureCache():
+    def __init__(self, cache_dir: str=FEATURE_CACHE_DIR, max_entries: int=8):
+        """
+        we will initialize the cache
+        args:
+            cache_dir: str - the folder of the cache, every entry is a sub folder named by its key
+            max_entries: int - the number of entries kept, the least recently used are removed
+        returns:
+            none
+        """
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+
+    def key(self, config: dict, data: dict):
+        """
+        we will build the key of an entry
+        args:
+            config: dict - the config of the transformation (transformer_config and any option changing the output)
+            data: dict - the sets the transformation reads, by name
+        returns:
+            str - the sha256 hex digest
+        """
+        key = {
+            'config': config,
+            'data': {name: data_hash(value) for name, value in sorted(data.items())},
+            'sklearn': sklearn.__version__,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str):
+        """
+        we will look up an entry
+        args:
+            key: str - the key of the entry
+        returns:
+            str - the folder of the entry, none when it is not cached
+        """
+        entry = os.path.join(self._cache_dir, key)
+        if not os.path.isdir(entry):
+            return None
+        # the modification time tells prune which entries were used last
+        os.utime(entry)
+        return entry
+
+    def stage(self, key: str):
+        """
+        we will create the folder a new entry is written into before commit makes it visible
+        """
+        staging = os.path.join(self._cache_dir, f"{key}.tmp-{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        return staging
+
+    def commit(self, key: str, staging: str):
+        """
+        we will turn a staged folder into the entry of the key with one rename, replacing an older entry
+        args:
+            key: str - the key of the entry
+            staging: str - the folder returned by stage
+        returns:
+            str - the folder of the entry
+        """
+        entry = os.path.join(self._cache_dir, key)
+        if os.path.isdir(entry):
+            # the old entry is moved aside first because a folder can only be renamed over an empty one
+            old = f"{entry}.old-{os.getpid()}"
+            os.replace(entry, old)
+            os.replace(staging, entry)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(staging, entry)
+        self.prune()
+        return entry
+
+    def prune(self):
+        """
+        we will remove the least recently used entries above max_entries
+        """
+        entries = [os.path.join(self._cache_dir, name) for name in os.listdir(self._cache_dir) if '.' not in name]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry in entries[self._max_entries:]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def _journal(self):
+        return os.path.join(self._cache_dir, "publish.json")
+
+    def _apply(self, journal: str):
+        with open(journal) as f:
+            steps = json.load(f)
+        for temp, path in steps:
+            if temp is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            elif os.path.exists(temp):
+                os.replace(temp, path)
+        os.remove(journal)
+
+    def recover(self):
+        """
+        we will finish a publish that was cut off after its journal was written, the outputs then all come from its entry
+        """
+        journal = self._journal()
+        if os.path.exists(journal):
+            self._apply(journal)
+            logging.info("an interrupted publish of the feature cache was completed")
+
+    def publish(self, entry: str, outputs: dict):
+        """
+        we will put the files of an entry where the pipeline reads them. every file is first linked next to its output,
+        then the list of renames is written to a journal and the renames run back to back. a crash after the journal
+        was written is rolled forward by the next publish (see recover), a crash before it leaves the old outputs, so
+        the outputs are never left as a mix of two entries. the renames are not one operation for a reader running
+        during them, the pipeline stages that read these files run one after another and serving never reads them
+        (see model_evaluation)
+        args:
+            entry: str - the folder of the entry
+            outputs: dict - the path of every file of the entry, by file name, a file the entry does not have is removed
+        returns:
+            none
+        """
+        self.recover()
+        steps = []
+        for name, path in outputs.items():
+            source = os.path.join(entry, name)
+            if not os.path.exists(source):
+                # for example x_test.npy when there was no test set, an old one would not belong to this preprocessor
+                steps.append((None, path))
+                continue
+            # the output may already be a link to this entry, renaming a link over itself would leave the temp file
+            if os.path.exists(path) and os.path.samefile(source, path):
+                continue
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            try:
+                # a hard link is instant, the writers of the outputs always replace files so they never change the entry
+                os.link(source, path + ".tmp")
+            except OSError:
+                shutil.copyfile(source, path + ".tmp")
+            steps.append((path + ".tmp", path))
+
+        journal = self._journal()
+        with open(journal + ".tmp", "w") as f:
+            json.dump(steps, f)
+        os.replace(journal + ".tmp", journal)
+        self._apply(journal)
+
+
+def run_cached(cache: FeatureCache, key: str, write, outputs: dict, use_cache: bool=True):
+    """
+    we will write the files of a transformation into a new cache entry unless the key is cached, then put them in place
+    args:
+        cache: FeatureCache - the cache
+        key: str - the key of the transformation
+        write - a function writing the files of the entry into the folder it gets
+        outputs: dict - the path of every file of the entry, by file name
+        use_cache: bool - false writes the entry again even when the key is cached
+    returns:
+        bool - true when the files came from the cache
+    """
+    entry = cache.get(key) if use_cache else None
+    hit = entry is not None
+    if hit:
+        logging.info(f"the features of {key[:12]} are cached, skipping the transformation..")
+    else:
+        staging = cache.stage(key)
+        try:
+            write(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        entry = cache.commit(key, staging)
+    cache.publish(entry, outputs)
+    return hit
+
+
 # this is the base class for feature engineering
 class FeatureEngineering(ABC):
     @abstractmethod
@@ -25,14 +292,18 @@ class FeatureEngineering(ABC):
         pass
 
 class x_FetureEngineering(FeatureEngineering):
-    def __init__(self, col_onehotencode: str, col_skewed: str, col_outliers: str, col_map_binary: str):
+    def __init__(self, col_onehotencode: str, col_skewed: str, col_outliers: str, col_map_binary: str, n_jobs: int=None, dtype: str='float64', cache: FeatureCache=None, use_cache: bool=True):
         """
         we will initialize all the necessary varibles needed for the transformation
         args:
             col_onehotencoding: Str - this si all the columns ee want to perform the one hot transformation on
             col_skewed: Str - this is the coluomns we want correct skewness on
             col_outliers: Str - this are the columns we want to reshape to remov outliers
-            method: str - this will determine whether we fit and or just transform
+            col_map_binary: Str - the yes/no columns we want to turn into 1/0
+            n_jobs: int - the number of branches of the column transformer run at the same time, -1 uses all cores
+            dtype: str - the type of the written arrays, float32 halves their size
+            cache: FeatureCache - the cache of fitted preprocessors and arrays, none uses FEATURE_CACHE_DIR
+            use_cache: bool - false fits and transforms again even when the inputs are cached
         returns:
             none
         """
@@ -40,31 +311,30 @@ class x_FetureEngineering(FeatureEngineering):
         self._col_skewed = col_skewed
         self._col_outliers = col_outliers
         self._col_map_binary = col_map_binary
+        self._n_jobs = n_jobs
+        self._dtype = numpy.dtype(dtype)
+        self._cache = cache if cache is not None else FeatureCache()
+        self._use_cache = use_cache
+        # true when the last apply_transformation found its files in the cache
+        self.cache_hit = False
 
-    def apply_transformation(self, x_train: pd.DataFrame, x_test: pd.DataFrame):
+    def build_preprocessor(self, categories='auto'):
         """
-        we will transfor the data 
+        we will build the (unfitted) column transformer
         args:
-            df: pd.Dtaframe - this will hold the dataframe of the data
+            categories: 'auto' or list - the categories of the one hot columns, 'auto' learns them in fit
         returns:
-            none
+            ColumnTransformer - the preprocessor
         """
         # we will use power transformer to handle skewness
         # we will use robust transformer to handle outliers
         Skew_tranform = PowerTransformer()
         outlier_transform = RobustScaler()
-        onehot_transform = OneHotEncoder()
-
-        # we will change yes to 1 and no to zero in columns with such values
-        def map(X):
-            # Ensure X is a 2D array for scikit-learn
-            X = X.reshape(-1, 1) if X.ndim == 1 else X
-            mapping = {'yes': 1, 'no': 0}
-            # Apply mapping and infer objects to avoid FutureWarning
-            mapped = pd.DataFrame(X).replace(mapping).infer_objects(copy=False).values
-            return mapped.astype(float)
-        
-        binary_map = FunctionTransformer(map)
+        onehot_transform = DictionaryEncoder(categories=categories, output='onehot')
+
+        # we will change yes to 1 and no to zero in columns with such values, 1/0 from the form mean the same
+        binary_map = DictionaryEncoder(categories=[FLAG_VOCABULARY] * len(self._col_map_binary),
+                                       aliases=FLAG_ALIASES, output='ordinal')
 
         preprocessor = ColumnTransformer(
             transformers=[
@@ -73,46 +343,65 @@ class x_FetureEngineering(FeatureEngineering):
                 ("one hot encode cat cols", onehot_transform, self._col_onehotencode),
                 ('map binary cols', binary_map, self._col_map_binary)
             ],
-            remainder='passthrough'
+            remainder='passthrough',
+            n_jobs=self._n_jobs
         )
+        return preprocessor
 
-        path = "data/arr_data/"
+    def cache_config(self):
+        """
+        we will describe everything that changes the fitted preprocessor or the arrays, except the data
+        returns:
+            dict - the config part of the cache key
+        """
+        return {'strategy': type(self).__name__, 'transformer': transformer_config(self.build_preprocessor()), 'dtype': str(self._dtype)}
 
-        if isinstance(x_train, pd.DataFrame):
-            xtrain = numpy.array(preprocessor.fit_transform(x_train))
-            # we vrify if the path exist else we will create it
-            os.makedirs(os.path.dirname(os.path.join(path, 'x_train.npy')), exist_ok=True)
-            joblib.dump(xtrain, path + 'x_train.npy')
-            if not os.path.exists('preprocessor.pkl'):
-                joblib.dump(preprocessor, 'preprocessor.pkl')
+    def apply_transformation(self, x_train: pd.DataFrame, x_test: pd.DataFrame):
+        """
+        we will transfor the data 
+        args:
+            df: pd.Dtaframe - this will hold the dataframe of the data
+        returns:
+            none
+        """
+        def _write(path: str):
+            preprocessor = self.build_preprocessor()
+            # asarray only copies when the dtype changes
+            xtrain = numpy.asarray(preprocessor.fit_transform(x_train), dtype=self._dtype)
+            save_array(xtrain, os.path.join(path, 'x_train.npy'))
+            joblib.dump(preprocessor, os.path.join(path, 'preprocessor.pkl'))
             print(xtrain[:2,:])
 
-        if isinstance(x_test, pd.DataFrame):
-            xtest = numpy.array(preprocessor.transform(x_test))
-            # we vrify if the path exist else we will create it
-            os.makedirs(os.path.dirname(os.path.join(path, 'x_test.npy')), exist_ok=True)
-            joblib.dump(xtest, path + 'x_test.npy')
-            print(xtest.shape)
+            if isinstance(x_test, pd.DataFrame):
+                xtest = numpy.asarray(preprocessor.transform(x_test), dtype=self._dtype)
+                save_array(xtest, os.path.join(path, 'x_test.npy'))
+                print(xtest.shape)
+
+        key = self._cache.key(self.cache_config(), {'x_train': x_train, 'x_test': x_test})
+        self.cache_hit = run_cached(self._cache, key, _write, X_OUTPUTS, use_cache=self._use_cache)
 
 
 
 class y_FetureEngineering(FeatureEngineering):
-    def __init__(self):
+    def __init__(self, cache: FeatureCache=None, use_cache: bool=True):
         """
         we will initialize the method for or transformation
         args:
-            none
+            cache: FeatureCache - the cache of fitted preprocessors and arrays, none uses FEATURE_CACHE_DIR
+            use_cache: bool - false fits and transforms again even when the inputs are cached
         returns:
             none
         """
+        self._cache = cache if cache is not None else FeatureCache()
+        self._use_cache = use_cache
+        # true when the last apply_transformation found its files in the cache
+        self.cache_hit = False
 
-    def apply_transformation(self, y_train: pd.DataFrame, y_test: pd.DataFrame):
+    def build_pipeline(self):
         """
-        we will transfor the data 
-        args:
-            df: pd.Dtaframe - this will hold the dataframe of the data
+        we will build the (unfitted) target pipeline
         returns:
-            none
+            Pipeline - the target preprocessor
         """
         # we will use power transformer to handle skewness
         # we will use robust transformer to handle outliers
@@ -126,24 +415,308 @@ class y_FetureEngineering(FeatureEngineering):
                 ("deal with outliers", outlier_transform),
             ],
         )
+        return pipline
 
-        path = "data/arr_data/"
+    def cache_config(self):
+        """
+        we will describe everything that changes the fitted pipeline or the arrays, except the data
+        returns:
+            dict - the config part of the cache key
+        """
+        return {'strategy': type(self).__name__, 'transformer': transformer_config(self.build_pipeline())}
 
-        if isinstance(y_train, pd.DataFrame):
+    def apply_transformation(self, y_train: pd.DataFrame, y_test: pd.DataFrame):
+        """
+        we will transfor the data 
+        args:
+            df: pd.Dtaframe - this will hold the dataframe of the data
+        returns:
+            none
+        """
+        def _write(path: str):
+            pipline = self.build_pipeline()
             ytrain = pipline.fit_transform(y_train)
-            # we vrify if the path exist else we will create it
-            os.makedirs(os.path.dirname(os.path.join(path, 'y_train.npy')), exist_ok=True)
-            joblib.dump(ytrain, path + 'y_train.npy')
-            if not os.path.exists('target_preprocessor.pkl'):
-                joblib.dump(pipline, 'target_preprocessor.pkl')
-
-        if isinstance(y_test, pd.DataFrame):
-            ytest = pipline.transform(y_test)
-            # we vrify if the path exist else we will create it
-            os.makedirs(os.path.dirname(os.path.join(path, 'y_test.npy')), exist_ok=True)
-            joblib.dump(ytest, path + 'y_test.npy')
+            save_array(ytrain, os.path.join(path, 'y_train.npy'))
+            joblib.dump(pipline, os.path.join(path, 'target_preprocessor.pkl'))
+
+            if isinstance(y_test, pd.DataFrame):
+                ytest = pipline.transform(y_test)
+                save_array(ytest, os.path.join(path, 'y_test.npy'))
+
+        key = self._cache.key(self.cache_config(), {'y_train': y_train, 'y_test': y_test})
+        self.cache_hit = run_cached(self._cache, key, _write, Y_OUTPUTS, use_cache=self._use_cache)
         
 
+# the lambdas of the first pass of the streaming Yeo-Johnson fit and the offsets of the last pass around the best one
+COARSE_LAMBDAS = numpy.linspace(-4, 4, 81)
+FINE_LAMBDAS = numpy.linspace(-0.1, 0.1, 101)
+
+
+def _scan_chunks(chunks, power_columns: list, sketch_columns: list, category_columns: list=(), sketch_size: int=100000):
+    """
+    we will make the first pass over the chunks: the coarse lambda grids, the quantile sketches, the categories seen,
+    the number of rows and the first chunk, which is kept as the sample the sklearn objects are fitted on
+    args:
+        chunks - a function returning an iterator of dataframe chunks
+        power_columns: list - the columns we need a Yeo-Johnson lambda for
+        sketch_columns: list - the columns we need quantiles of
+        category_columns: list - the columns we collect the categories of
+        sketch_size: int - the number of distinct values a sketch keeps exactly
+    returns:
+        dict - rows, sample, grids, sketches and categories
+    """
+    scan = {
+        'rows': 0,
+        'sample': None,
+        'grids': {column: YeoJohnsonGrid(COARSE_LAMBDAS) for column in power_columns},
+        'sketches': {column: QuantileSketch(sketch_size) for column in set(sketch_columns) | set(power_columns)},
+        'categories': {column: set() for column in category_columns},
+    }
+    for chunk in chunks():
+        if scan['sample'] is None:
+            scan['sample'] = chunk
+        scan['rows'] += len(chunk)
+        for column, grid in scan['grids'].items():
+            grid.update(chunk[column].to_numpy(dtype=float))
+        for column, sketch in scan['sketches'].items():
+            sketch.update(chunk[column].to_numpy(dtype=float))
+        for column, categories in scan['categories'].items():
+            categories.update(str(value) for value in pd.unique(chunk[column].dropna()))
+
+    if scan['rows'] == 0:
+        raise ValueError("there are no rows to fit on.")
+    return scan
+
+
+def _grid_pass(chunks, grids: dict):
+    """
+    we will make one pass over the chunks updating the lambda grid of every column
+    """
+    if grids:
+        for chunk in chunks():
+            for column, grid in grids.items():
+                grid.update(chunk[column].to_numpy(dtype=float))
+    return grids
+
+
+def _fit_lambdas(chunks, scan: dict, max_passes: int=5):
+    """
+    we will find the lambda of every column with more passes over the chunks. sklearn's search is not bounded, so
+    while the best lambda is on the edge of its grid the grid is moved past that edge, then a fine grid around the
+    best lambda is evaluated
+    args:
+        chunks - a function returning an iterator of dataframe chunks
+        scan: dict - the result of the first pass
+        max_passes: int - the most passes used to move the grids
+    returns:
+        dict - (lambda, mean, variance of the transformed values) of every column
+    """
+    fitted = {}
+    grids = {}
+    for column, grid in scan['grids'].items():
+        sketch = scan['sketches'][column]
+        if len(sketch.values) <= 1:
+            # like sklearn a constant column is left unchanged (lambda 1)
+            fitted[column] = (1.0, float(sketch.values[0]) if len(sketch.values) else 0.0, 0.0)
+        else:
+            grids[column] = grid
+
+    offsets = COARSE_LAMBDAS - COARSE_LAMBDAS.mean()
+    for _ in range(max_passes):
+        edges = {column: grid.best()[0] for column, grid in grids.items()
+                 if grid.best()[0] in (grid.lambdas[0], grid.lambdas[-1])}
+        if not edges:
+            break
+        moved = _grid_pass(chunks, {column: YeoJohnsonGrid(lmbda + offsets) for column, lmbda in edges.items()})
+        grids.update(moved)
+
+    fine = _grid_pass(chunks, {column: YeoJohnsonGrid(grid.best()[0] + FINE_LAMBDAS) for column, grid in grids.items()})
+    for column, grid in fine.items():
+        fitted[column] = grid.best()
+    return fitted
+
+
+def _set_power_params(power: PowerTransformer, fitted: list, rows: int):
+    """
+    we will put the streamed lambdas and moments into a power transformer fitted on a sample
+    """
+    power.lambdas_ = numpy.array([lmbda for lmbda, _, _ in fitted], dtype=float)
+    if power.standardize:
+        var = numpy.array([var for _, _, var in fitted], dtype=float)
+        power._scaler.mean_ = numpy.array([mean for _, mean, _ in fitted], dtype=float)
+        power._scaler.var_ = var
+        # a zero variance is scaled by 1, like sklearn does
+        power._scaler.scale_ = numpy.where(var > 10 * numpy.finfo(float).eps, numpy.sqrt(var), 1.0)
+        power._scaler.n_samples_seen_ = rows
+
+
+def _set_robust_params(robust: RobustScaler, sketches: list):
+    """
+    we will put the streamed median and quantile range into a robust scaler fitted on a sample
+    """
+    q_min, q_max = robust.quantile_range
+    quantiles = numpy.array([sketch.quantile([q_min / 100, 0.5, q_max / 100]) for sketch in sketches])
+    if robust.with_centering:
+        robust.center_ = quantiles[:, 1]
+    if robust.with_scaling:
+        scale = quantiles[:, 2] - quantiles[:, 0]
+        robust.scale_ = numpy.where(scale == 0, 1.0, scale)
+
+
+def _transform_chunks(transform, chunks, path: str, dtype, rows: int=None):
+    """
+    we will transform the chunks one by one into a .npy file on disk, only one chunk is in memory at a time
+    args:
+        transform - the function transforming a chunk
+        chunks - a function returning an iterator of dataframe chunks
+        path: str - the .npy file
+        dtype - the type of the array
+        rows: int - the number of rows, counted with an extra pass when none
+    returns:
+        none
+    """
+    if rows is None:
+        rows = sum(len(chunk) for chunk in chunks())
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = path + ".tmp.npy"
+    array = None
+    start = 0
+    for chunk in chunks():
+        transformed = numpy.asarray(transform(chunk), dtype=dtype)
+        if array is None:
+            array = numpy.lib.format.open_memmap(temp_path, mode='w+', dtype=dtype, shape=(rows, transformed.shape[1]))
+        array[start:start + len(transformed)] = transformed
+        start += len(transformed)
+
+    if array is None:
+        raise ValueError("there are no rows to transform.")
+    if start != rows:
+        raise ValueError(f"expected {rows} rows but the chunks gave {start}.")
+    array.flush()
+    del array
+    os.replace(temp_path, path)
+
+
+# we will fit the same preprocessor as x_FetureEngineering in a few passes over chunks of the data and transform it
+# chunk by chunk, so the train set never has to fit in memory
+class x_StreamingFeatureEngineering(x_FetureEngineering):
+    def __init__(self, col_onehotencode: str, col_skewed: str, col_outliers: str, col_map_binary: str, n_jobs: int=None, dtype: str='float64', sketch_size: int=100000, cache: FeatureCache=None, use_cache: bool=True):
+        """
+        we will initialize all the necessary varibles needed for the transformation
+        args:
+            col_onehotencoding: Str - this si all the columns ee want to perform the one hot transformation on
+            col_skewed: Str - this is the coluomns we want correct skewness on
+            col_outliers: Str - this are the columns we want to reshape to remov outliers
+            col_map_binary: Str - the yes/no columns we want to turn into 1/0
+            n_jobs: int - the number of branches of the column transformer run at the same time, -1 uses all cores
+            dtype: str - the type of the written arrays, float32 halves their size
+            sketch_size: int - the number of distinct values of a column whose quantiles are kept exactly
+            cache: FeatureCache - the cache of fitted preprocessors and arrays, none uses FEATURE_CACHE_DIR
+            use_cache: bool - false fits and transforms again even when the inputs are cached
+        returns:
+            none
+        """
+        super().__init__(col_onehotencode, col_skewed, col_outliers, col_map_binary, n_jobs=n_jobs, dtype=dtype, cache=cache, use_cache=use_cache)
+        self._sketch_size = sketch_size
+
+    def cache_config(self):
+        """
+        we will describe everything that changes the fitted preprocessor or the arrays, except the data
+        returns:
+            dict - the config part of the cache key
+        """
+        return {**super().cache_config(), 'sketch_size': self._sketch_size}
+
+    def apply_transformation(self, x_train, x_test):
+        """
+        we will fit the preprocessor on the chunks of the train set and transform both sets chunk by chunk
+        args:
+            x_train - a function returning an iterator of train chunks (for example partial(iter_split_chunks, 'x_train'))
+            x_test - a function returning an iterator of test chunks
+        returns:
+            none
+        """
+        def _write(path: str):
+            scan = _scan_chunks(x_train, self._col_skewed, self._col_outliers, self._col_onehotencode, self._sketch_size)
+            fitted = _fit_lambdas(x_train, scan)
+
+            # the sklearn objects are fitted on the first chunk and get the parameters of the whole train set
+            categories = [sorted(scan['categories'][column]) for column in self._col_onehotencode]
+            preprocessor = self.build_preprocessor(categories=categories)
+            preprocessor.fit(scan['sample'])
+            _set_power_params(preprocessor.named_transformers_['remove skewness'],
+                              [fitted[column] for column in self._col_skewed], scan['rows'])
+            _set_robust_params(preprocessor.named_transformers_['deal with outliers'],
+                               [scan['sketches'][column] for column in self._col_outliers])
+
+            _transform_chunks(preprocessor.transform, x_train, os.path.join(path, 'x_train.npy'), self._dtype, rows=scan['rows'])
+            joblib.dump(preprocessor, os.path.join(path, 'preprocessor.pkl'))
+            if x_test is not None:
+                _transform_chunks(preprocessor.transform, x_test, os.path.join(path, 'x_test.npy'), self._dtype)
+
+        # hashing the chunks is one more pass, much cheaper than the passes of the fit
+        key = self._cache.key(self.cache_config(), {'x_train': x_train, 'x_test': x_test})
+        self.cache_hit = run_cached(self._cache, key, _write, X_OUTPUTS, use_cache=self._use_cache)
+
+
+# we will fit the same target pipeline as y_FetureEngineering in a few passes over chunks of the target
+class y_StreamingFeatureEngineering(y_FetureEngineering):
+    def __init__(self, sketch_size: int=100000, cache: FeatureCache=None, use_cache: bool=True):
+        """
+        we will initialize the method for or transformation
+        args:
+            sketch_size: int - the number of distinct values of the target whose quantiles are kept exactly
+            cache: FeatureCache - the cache of fitted preprocessors and arrays, none uses FEATURE_CACHE_DIR
+            use_cache: bool - false fits and transforms again even when the inputs are cached
+        returns:
+            none
+        """
+        super().__init__(cache=cache, use_cache=use_cache)
+        self._sketch_size = sketch_size
+
+    def cache_config(self):
+        """
+        we will describe everything that changes the fitted pipeline or the arrays, except the data
+        returns:
+            dict - the config part of the cache key
+        """
+        return {**super().cache_config(), 'sketch_size': self._sketch_size}
+
+    def apply_transformation(self, y_train, y_test):
+        """
+        we will fit the target pipeline on the chunks of the train target and transform both sets chunk by chunk
+        args:
+            y_train - a function returning an iterator of train target chunks (one column dataframes)
+            y_test - a function returning an iterator of test target chunks
+        returns:
+            none
+        """
+        def _write(path: str):
+            column = next(iter(y_train())).columns[0]
+            scan = _scan_chunks(y_train, [column], [], sketch_size=self._sketch_size)
+            fitted = _fit_lambdas(y_train, scan)
+
+            pipline = self.build_pipeline()
+            pipline.fit(scan['sample'])
+            power = pipline.named_steps['remove skewness']
+            _set_power_params(power, [fitted[column]], scan['rows'])
+
+            # the robust scaler comes after the power transform, so its quantiles need a pass over the transformed target
+            sketch = QuantileSketch(self._sketch_size)
+            for chunk in y_train():
+                sketch.update(power.transform(chunk))
+            _set_robust_params(pipline.named_steps['deal with outliers'], [sketch])
+
+            _transform_chunks(pipline.transform, y_train, os.path.join(path, 'y_train.npy'), float, rows=scan['rows'])
+            joblib.dump(pipline, os.path.join(path, 'target_preprocessor.pkl'))
+            if y_test is not None:
+                _transform_chunks(pipline.transform, y_test, os.path.join(path, 'y_test.npy'), float)
+
+        key = self._cache.key(self.cache_config(), {'y_train': y_train, 'y_test': y_test})
+        self.cache_hit = run_cached(self._cache, key, _write, Y_OUTPUTS, use_cache=self._use_cache)
+
+
 # this class helps us to select the preferred style of data engineering
 class selectFeatureEngineeringStrtegy():
     def __init__(self):
@@ -155,6 +728,8 @@ class selectFeatureEngineeringStrtegy():
             None - we will jsut set the strategy to the base strategy
         """
         # self._strategy = strategy
+        # true when the last execute_strategy call found its files in the feature cache
+        self.cache_hit = False
 
     def set_strategy(self, strategy):
         """
@@ -166,25 +741,26 @@ class selectFeatureEngineeringStrtegy():
         """
         self._strategy = strategy
 
-    def execute_strategy(self,df_train: pd.DataFrame, df_test: pd.DataFrame, col_onehotencode, col_skewed, col_outliers, col_map_binary):
+    def execute_strategy(self,df_train: pd.DataFrame, df_test: pd.DataFrame, col_onehotencode, col_skewed, col_outliers, col_map_binary, **options):
         """
         we will execute the srategy we have set
         args:
             df: pd.Dataframe - this will hold our datafrane
             columns: str - this is a list of all the columns we want perform feature engineering on
+            options - the other options of the strategy (n_jobs, dtype, sketch_size, cache, use_cache)
+            df_train/df_test can be functions returning iterators of chunks for the streaming strategies
         returns:
             pd.Dataframe - returns a pandas dataframe
         """
-        if self._strategy == x_FetureEngineering:
-            self._strategy = x_FetureEngineering
-            self._strategy = self._strategy(col_onehotencode=col_onehotencode,col_skewed=col_skewed,col_outliers=col_outliers,col_map_binary=col_map_binary)
+        if self._strategy in (x_FetureEngineering, x_StreamingFeatureEngineering):
+            self._strategy = self._strategy(col_onehotencode=col_onehotencode,col_skewed=col_skewed,col_outliers=col_outliers,col_map_binary=col_map_binary,**options)
             self._strategy.apply_transformation(x_train=df_train,x_test=df_test)
-        elif self._strategy == y_FetureEngineering:
-            self._strategy = y_FetureEngineering
-            self._strategy = self._strategy()
+        elif self._strategy in (y_FetureEngineering, y_StreamingFeatureEngineering):
+            self._strategy = self._strategy(**options)
             self._strategy.apply_transformation(y_train=df_train,y_test=df_test)
         else:
             raise ValueError('the strategy is invalid..')
+        self.cache_hit = self._strategy.cache_hit
     
 
 # # example use case
@@ -1,5 +1,7 @@
 import os
 import sys
+import time
+import logging
 import numpy
 import pandas as pd
 from abc import ABC, abstractmethod
@@ -9,6 +11,7 @@ import dagshub
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import GridSearchCV
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, StackingRegressor
+from _src.model_search import make_search, search_report
 
 
 # initialize dagshub for the mlflow tracking
@@ -22,12 +25,13 @@ mlflow.set_tracking_uri("https://dagshub.com/nageteychristopher/house_price_pred
 # this the base class for training our model
 class TrainModel(ABC):
     @abstractmethod
-    def train(self, df_train, df_prid):
+    def train(self, df_train, df_prid, cv=10):
         """
         we will call this function to train our model
         args:
             df_train: pd.Dataframe - this will hold the training data (the features)
             df_pred: pd.Dataframe - this will hold the prediction (the goal)
+            cv - the number of folds or the saved folds (see load_folds)
         returns:
             none - we will save the model to mlflow for comparing
         """
@@ -35,11 +39,11 @@ class TrainModel(ABC):
 
 # we will train the a linear regression model
 class LinearRegressionModel(TrainModel):
-    def train(self, df_train, df_prid):
+    def train(self, df_train, df_prid, cv=10):
         """
         we will train a linear regresion model
         args:
-            none
+            cv - the number of folds or the saved folds (see load_folds)
         returns:
             none
         """
@@ -55,7 +59,7 @@ class LinearRegressionModel(TrainModel):
                 'copy_X': [True,True]
             }
 
-            grid_search = GridSearchCV(clf,param_grid=param_grid, scoring="accuracy",return_train_score=True,cv=10)
+            grid_search = GridSearchCV(clf,param_grid=param_grid, scoring="accuracy",return_train_score=True,cv=cv)
 
             grid_search.fit(df_train,df_prid)
 
@@ -63,16 +67,31 @@ class LinearRegressionModel(TrainModel):
 
 # we will combine models and train them together called Model stacking
 class StackingModels(TrainModel):
-    def train(self, df_train, df_prid):
+    def __init__(self, search: str='halving', n_jobs: int=-1, **search_options):
         """
-        we will perform model stacking with sklearn
+        we will initialize the hyperparameter search of the stack
         args:
+            search: str - the search strategy ['grid', 'random', 'halving', 'halving_random', 'budget'], see make_search
+            n_jobs: int - the number of fits run at the same time, -1 (the default) uses all cores
+            search_options - n_iter, factor, budget_seconds, margin and random_state of the search
+        returns:
             none
+        """
+        self._search = search
+        self._n_jobs = n_jobs
+        self._search_options = search_options
+
+    def train(self, df_train, df_prid, cv=10):
+        """
+        we will perform model stacking with sklearn
+        args:
+            cv - the number of folds or the saved folds (see load_folds), the stacker keeps its own 3 inner folds
         returns:
             none
         """
-        # we will automatically log sklearn params, artifacts and metrics of our model
-        mlflow.sklearn.autolog()
+        # we will automatically log sklearn params, artifacts and metrics of our model, autolog only knows the sklearn
+        # searches so the budgeted search logs its results below
+        mlflow.sklearn.autolog(disable=self._search == 'budget')
 
         # we will start a new run 
         with mlflow.start_run(run_name="Sklearn Model Stacking"):
@@ -93,52 +112,54 @@ class StackingModels(TrainModel):
                 passthrough=True
             )
 
-            # perform hyperparameter tunning
-            param_grid = {
-                'rf__n_estimators': [100,200,300,500],
-                'gb__n_estimators': [100,200,300,500],
-                'rf__max_depth': [3,5,7],
-                'gb__max_depth': [3,5,7]
-            }
+            # perform hyperparameter tunning, the searches run n_jobs fits at a time and the halving and budgeted
+            # searches drop the candidates that clearly lose before fitting them on all the data
+            search = make_search(self._search, model_stacking, cv=cv, n_jobs=self._n_jobs, **self._search_options)
 
-            grid_search = GridSearchCV(
-                model_stacking,
-                param_grid=param_grid,
-                scoring="accuracy",
-                cv=10
-            )
+            start = time.perf_counter()
+            # the stacker wants a 1D target, the feature engineering writes a column
+            search.fit(df_train,numpy.ravel(df_prid))
+            report = search_report(search, time.perf_counter() - start)
 
-            grid_search.fit(df_train,df_prid)
+            mlflow.log_param("search_strategy", self._search)
+            if self._search == 'budget':
+                mlflow.log_params(search.best_params_)
+            mlflow.log_metrics(report)
+            logging.info(f"{self._search} search: {report['search_candidates']} candidates, {report['search_fits']} fits, "
+                         f"{report['search_fit_time']:.1f}s of fitting in {report['search_wall_time']:.1f}s")
 
 
 # create a class to seect a model trainer
 class selectmodel():
-    def set_strategy (self, strategy):
+    def set_strategy (self, strategy, **options):
         """
         we will set the strategy for traning our model
         args:
             strategy - this will hold the strategy
+            options - the options of the strategy
         returns:
             none
         """
-        self._strategy = strategy()
+        self._strategy = strategy(**options)
 
-    def execute_model_train(self, df_train, df_pred, model: str):
+    def execute_model_train(self, df_train, df_pred, model: str, cv=10, **options):
         """
         we will select the model we want to use or tein our data on
         args:
             df_train - this will hold the x_train part of oour data
             df_pred - this the corresponding y_train data
             model: str - this will lets us decide whether we will use the linear regressor or model stacking ['linear','stacking']
+            cv - the number of folds or the saved folds (see load_folds)
+            options - the search options of the stacking model (search, n_jobs, n_iter, factor, budget_seconds, ...)
             returns
                 none
         """
         if isinstance(model,str) and model == 'linear':
             self.set_strategy(LinearRegressionModel)
-            self._strategy.train(df_train=df_train,df_prid=df_pred)
+            self._strategy.train(df_train=df_train,df_prid=df_pred,cv=cv)
         elif isinstance(model,str) and model == 'stacking':
-            self.set_strategy(StackingModels)
-            self._strategy.train(df_train=df_train,df_prid=df_pred)
+            self.set_strategy(StackingModels, **options)
+            self._strategy.train(df_train=df_train,df_prid=df_pred,cv=cv)
         else:
             raise ValueError("model not specified.. [ linear, stacking ]")
         
@@ -1,5 +1,8 @@
 import os
 import sys
+import json
+import time
+import shutil
 
 import numpy
 import mlflow
@@ -8,8 +11,10 @@ import pandas as pd
 from abc import ABC, abstractmethod
 import dagshub
 import joblib
+import logging
 
 from sklearn.metrics import r2_score, mean_absolute_error, root_mean_squared_error, mean_squared_error
+from _src.feature_engineering import ARRAY_DIR
 
 # initialize dagshub for the mlflow tracking
 dagshub.init(repo_owner='nageteychristopher', repo_name='house_price_predictor', mlflow=True)
@@ -18,6 +23,66 @@ dagshub.init(repo_owner='nageteychristopher', repo_name='house_price_predictor',
 mlflow.set_tracking_uri("https://dagshub.com/nageteychristopher/house_price_predictor.mlflow")
 
 
+# every published set of serving artifacts gets its own folder here, the pointer file names the set the app serves
+SERVING_DIR = "serving/"
+SERVING_POINTER = "serving.json"
+# the sets kept besides the current one, an app still loading the previous set must find its files
+KEEP_SERVING_VERSIONS = 2
+
+
+def publish_serving_artifacts(model, model_path: str, array_dir: str=ARRAY_DIR, serving_dir: str=SERVING_DIR,
+                              pointer_path: str=SERVING_POINTER):
+    """
+    we will publish the model with the preprocessors the feature engineering fitted, so the app always loads a model
+    with the preprocessors it fits. the three files are written into a new folder of serving_dir and the pointer file
+    is switched to that folder with one rename, a reader sees either the whole old set or the whole new set. when the
+    model was trained on other features nothing is published, the app keeps serving the old set until a model trained
+    on the new features is evaluated
+    args:
+        model - the evaluated model
+        model_path: str - the file name of the model in the published set
+        array_dir: str - the folder of the arrays and of the preprocessors that produced them
+        serving_dir: str - the folder of the published sets
+        pointer_path: str - the file naming the set the app serves (see model_holder)
+    returns:
+        bool - true when a new set was published
+    """
+    preprocessor = joblib.load(os.path.join(array_dir, 'preprocessor.pkl'))
+    target_pipeline = joblib.load(os.path.join(array_dir, 'target_preprocessor.pkl'))
+
+    n_features = len(preprocessor.get_feature_names_out())
+    if getattr(model, 'n_features_in_', n_features) != n_features:
+        logging.warning(f"the model expects {model.n_features_in_} features but the preprocessor produces {n_features}, "
+                        f"the serving artifacts were not replaced, retrain the model.")
+        return False
+
+    # the set is written into a staging folder and renamed, a folder in serving_dir is always complete
+    version = time.strftime("%Y%m%d-%H%M%S-") + f"{time.time_ns() % 10**9:09d}"
+    folder = os.path.join(serving_dir, version)
+    staging = folder + ".tmp"
+    os.makedirs(staging)
+    files = {'model': os.path.basename(model_path), 'preprocessor': 'preprocessor.pkl',
+             'target_preprocessor': 'target_preprocessor.pkl'}
+    for name, obj in (('model', model), ('preprocessor', preprocessor), ('target_preprocessor', target_pipeline)):
+        joblib.dump(obj, os.path.join(staging, files[name]))
+    os.replace(staging, folder)
+
+    # the paths in the pointer are relative to its folder
+    root = os.path.dirname(pointer_path)
+    pointer = {'version': version}
+    pointer.update({name: os.path.relpath(os.path.join(folder, file), root or '.') for name, file in files.items()})
+    with open(pointer_path + ".tmp", "w") as f:
+        json.dump(pointer, f, indent=2)
+    os.replace(pointer_path + ".tmp", pointer_path)
+    logging.info(f"serving artifacts {version} published")
+
+    # the names sort by publish time
+    versions = sorted(name for name in os.listdir(serving_dir) if '.' not in name and name != version)
+    for name in versions[:max(0, len(versions) - KEEP_SERVING_VERSIONS)]:
+        shutil.rmtree(os.path.join(serving_dir, name), ignore_errors=True)
+    return True
+
+
 # this is a base class to evaluate a model
 class EvaluateModel(ABC):
     @abstractmethod
@@ -81,9 +146,8 @@ class EvaluateLinearModel(EvaluateModel):
             load_model_url = f"models:/{model_name}/{model_version}"
             model = mlflow.sklearn.load_model(load_model_url)
 
-            # we will save the model for our app
-            if not os.path.exists('model_linear.pkl'):
-                joblib.dump(model, "model_linear.pkl")
+            # we will save the model for our app, together with the preprocessors of the arrays it is evaluated on
+            publish_serving_artifacts(model, "model_linear.pkl")
 
             model_y_pred = model.predict(df_test)
 
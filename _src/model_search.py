@@ -0,0 +1,211 @@
+import time
+import numpy
+from scipy.stats import randint
+
+from sklearn.base import BaseEstimator, clone
+from sklearn.model_selection import GridSearchCV, RandomizedSearchCV, ParameterSampler, check_cv, cross_validate
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (makes the halving searches importable)
+from sklearn.model_selection import HalvingGridSearchCV, HalvingRandomSearchCV
+from joblib import effective_n_jobs
+
+# accuracy is a classification score, the searches compare regressors by their root mean squared error
+SCORING = 'neg_root_mean_squared_error'
+
+# the grid of the stacking search (4 x 4 x 3 x 3 = 144 candidates)
+STACKING_PARAM_GRID = {
+    'rf__n_estimators': [100,200,300,500],
+    'gb__n_estimators': [100,200,300,500],
+    'rf__max_depth': [3,5,7],
+    'gb__max_depth': [3,5,7]
+}
+
+# the same space for the random searches, the tree counts are drawn from the whole range
+STACKING_PARAM_DISTRIBUTIONS = {
+    'rf__n_estimators': randint(100, 501),
+    'gb__n_estimators': randint(100, 501),
+    'rf__max_depth': [3,5,7],
+    'gb__max_depth': [3,5,7]
+}
+
+
+# we will try random candidates one after another until the time budget is spent. the folds of a candidate are fitted
+# n_jobs at a time and a candidate whose folds so far score clearly below the best candidate is dropped early
+class BudgetedSearchCV(BaseEstimator):
+    def __init__(self, estimator, param_distributions: dict, budget_seconds: float=3600, max_candidates: int=None, scoring=None, cv=5, n_jobs: int=None, margin: float=1.0, refit: bool=True, random_state=None):
+        """
+        we will initialize the search
+        args:
+            estimator - the estimator we tune
+            param_distributions: dict - the lists or scipy distributions the params are drawn from
+            budget_seconds: float - no new candidate or block of folds is started after this many seconds, a block
+                                    already running is finished
+            max_candidates: int - the most candidates tried, none tries candidates until the budget is spent
+            scoring - the sklearn scoring, higher is better
+            cv - the number of folds or the folds themselves
+            n_jobs: int - the number of folds fitted at the same time, -1 uses all cores
+            margin: float - a candidate is dropped when its mean score is more than margin standard deviations
+                            (of the best candidate's fold scores) below the best mean score
+            refit: bool - fit the best candidate on all the data at the end
+            random_state - the seed of the candidates
+        returns:
+            none
+        """
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.budget_seconds = budget_seconds
+        self.max_candidates = max_candidates
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.margin = margin
+        self.refit = refit
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        """
+        we will search the candidates within the budget
+        args:
+            X - the features
+            y - the target
+        returns:
+            BudgetedSearchCV - the fitted search
+        """
+        splits = list(check_cv(self.cv).split(X, y))
+        # the folds are fitted in blocks of n_jobs, the scores are checked after every block
+        block = max(1, min(effective_n_jobs(self.n_jobs), len(splits)))
+        n_iter = self.max_candidates if self.max_candidates is not None else numpy.iinfo(numpy.int32).max
+        candidates = ParameterSampler(self.param_distributions, n_iter=n_iter, random_state=self.random_state)
+
+        results = {'params': [], 'mean_test_score': [], 'std_test_score': [], 'mean_fit_time': [], 'n_folds': [], 'stopped_early': []}
+        best = None
+        start = time.perf_counter()
+        for params in candidates:
+            if time.perf_counter() - start > self.budget_seconds:
+                break
+            estimator = clone(self.estimator).set_params(**params)
+
+            scores, fit_times = [], []
+            out_of_time = False
+            for i in range(0, len(splits), block):
+                # a candidate cut off by the budget only counts when all its folds were scored
+                if i > 0 and time.perf_counter() - start > self.budget_seconds:
+                    out_of_time = True
+                    break
+                folds = cross_validate(estimator, X, y, cv=splits[i:i + block], scoring=self.scoring, n_jobs=self.n_jobs)
+                scores.extend(folds['test_score'])
+                fit_times.extend(folds['fit_time'])
+                if best is not None and numpy.mean(scores) < best[0] - self.margin * best[1]:
+                    break
+
+            stopped_early = len(scores) < len(splits)
+            results['params'].append(params)
+            results['mean_test_score'].append(float(numpy.mean(scores)))
+            results['std_test_score'].append(float(numpy.std(scores)))
+            results['mean_fit_time'].append(float(numpy.mean(fit_times)))
+            results['n_folds'].append(len(scores))
+            results['stopped_early'].append(stopped_early)
+            if not stopped_early and (best is None or numpy.mean(scores) > best[0]):
+                best = (float(numpy.mean(scores)), float(numpy.std(scores)), len(results['params']) - 1)
+            if out_of_time:
+                break
+
+        if best is None and results['params']:
+            # the budget ran out before any candidate got all its folds, we take the best of the folds it got
+            i = int(numpy.argmax(results['mean_test_score']))
+            best = (results['mean_test_score'][i], results['std_test_score'][i], i)
+        if best is None:
+            raise ValueError("no candidate was cross validated within the budget.")
+
+        self.cv_results_ = {name: numpy.asarray(values) if name != 'params' else values for name, values in results.items()}
+        self.best_index_ = best[2]
+        self.best_score_ = best[0]
+        self.best_params_ = results['params'][best[2]]
+        self.n_candidates_ = len(results['params'])
+        self.n_splits_ = len(splits)
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+
+def _grid_search(estimator, cv, n_jobs, scoring, random_state, **options):
+    return GridSearchCV(estimator, param_grid=STACKING_PARAM_GRID, scoring=scoring, cv=cv, n_jobs=n_jobs)
+
+
+def _random_search(estimator, cv, n_jobs, scoring, random_state, n_iter: int=20, **options):
+    return RandomizedSearchCV(estimator, param_distributions=STACKING_PARAM_DISTRIBUTIONS, n_iter=n_iter,
+                              scoring=scoring, cv=cv, n_jobs=n_jobs, random_state=random_state)
+
+
+def _halving_search(estimator, cv, n_jobs, scoring, random_state, factor: int=3, **options):
+    # every round keeps the best 1/factor of the candidates and gives them factor times more rows
+    return HalvingGridSearchCV(estimator, param_grid=STACKING_PARAM_GRID, factor=factor, scoring=scoring,
+                               cv=cv, n_jobs=n_jobs, random_state=random_state)
+
+
+def _halving_random_search(estimator, cv, n_jobs, scoring, random_state, factor: int=3, n_iter: int=None, **options):
+    return HalvingRandomSearchCV(estimator, param_distributions=STACKING_PARAM_DISTRIBUTIONS, factor=factor,
+                                 n_candidates=n_iter if n_iter is not None else 'exhaust', scoring=scoring,
+                                 cv=cv, n_jobs=n_jobs, random_state=random_state)
+
+
+def _budget_search(estimator, cv, n_jobs, scoring, random_state, budget_seconds: float=3600, n_iter: int=None, margin: float=1.0, **options):
+    return BudgetedSearchCV(estimator, param_distributions=STACKING_PARAM_DISTRIBUTIONS, budget_seconds=budget_seconds,
+                            max_candidates=n_iter, scoring=scoring, cv=cv, n_jobs=n_jobs, margin=margin,
+                            random_state=random_state)
+
+
+# the search strategies by name
+SEARCHES = {
+    'grid': _grid_search,
+    'random': _random_search,
+    'halving': _halving_search,
+    'halving_random': _halving_random_search,
+    'budget': _budget_search,
+}
+
+
+def make_search(search: str, estimator, cv=10, n_jobs: int=None, scoring=SCORING, random_state=42, **options):
+    """
+    we will build the hyperparameter search of the stacking model
+    args:
+        search: str - the strategy ['grid', 'random', 'halving', 'halving_random', 'budget']
+        estimator - the estimator we tune
+        cv - the number of folds or the saved folds (see load_folds)
+        n_jobs: int - the number of fits run at the same time, -1 uses all cores
+        scoring - the sklearn scoring
+        random_state - the seed of the random and halving searches
+        options - n_iter (random, halving_random, budget), factor (halving), budget_seconds and margin (budget)
+    returns:
+        the unfitted search
+    """
+    if search not in SEARCHES:
+        raise ValueError(f"search not supported.. {list(SEARCHES)}")
+    return SEARCHES[search](estimator, cv=cv, n_jobs=n_jobs, scoring=scoring, random_state=random_state, **options)
+
+
+def search_report(search, wall_time: float):
+    """
+    we will summarize the cost of a fitted search
+    args:
+        search - the fitted search
+        wall_time: float - the seconds the fit took
+    returns:
+        dict - the number of cross validation fits, their summed fit time, the wall time and the best score
+    """
+    results = search.cv_results_
+    # the halving searches have one row per candidate and round, n_candidates_ has the candidates of every round
+    n_candidates = search.n_candidates_[0] if hasattr(search, 'n_candidates_') and numpy.ndim(search.n_candidates_) else \
+        getattr(search, 'n_candidates_', len(results['params']))
+    # the budgeted search records how many folds every candidate got, the others fit every fold of every candidate
+    n_folds = numpy.asarray(results['n_folds']) if 'n_folds' in results else search.n_splits_
+    fit_times = numpy.asarray(results['mean_fit_time']) * n_folds
+    return {
+        'search_candidates': int(n_candidates),
+        'search_fits': int(numpy.sum(numpy.broadcast_to(n_folds, fit_times.shape))),
+        'search_fit_time': float(numpy.sum(fit_times)),
+        'search_wall_time': float(wall_time),
+        'search_best_score': float(search.best_score_),
+    }
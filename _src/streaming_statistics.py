@@ -0,0 +1,153 @@
+import numpy
+
+_EPS = numpy.spacing(1.0)
+
+
+def yeo_johnson(x, lmbda: float):
+    """
+    we will apply the Yeo-Johnson transform with the same branches as scipy (which sklearn's PowerTransformer uses)
+    args:
+        x: numpy.array - the values
+        lmbda: float - the lambda of the transform
+    returns:
+        numpy.array - the transformed values
+    """
+    out = numpy.empty_like(x, dtype=float)
+    pos = x >= 0
+    if abs(lmbda) < _EPS:
+        out[pos] = numpy.log1p(x[pos])
+    else:
+        out[pos] = numpy.expm1(lmbda * numpy.log1p(x[pos])) / lmbda
+    if abs(lmbda - 2) > _EPS:
+        out[~pos] = -numpy.expm1((2 - lmbda) * numpy.log1p(-x[~pos])) / (2 - lmbda)
+    else:
+        out[~pos] = -numpy.log1p(-x[~pos])
+    return out
+
+
+# we will keep the quantiles of a stream of values. every distinct value is kept with its count, so the quantiles are
+# exact (the linear interpolation of numpy.percentile) until there are more than max_size distinct values, after that
+# neighbouring values are merged and the quantiles become approximate
+class QuantileSketch():
+    def __init__(self, max_size: int=100000):
+        """
+        we will initialize an empty sketch
+        args:
+            max_size: int - the number of distinct values kept before neighbours are merged
+        returns:
+            none
+        """
+        self._max_size = max_size
+        self.values = numpy.empty(0)
+        self.weights = numpy.empty(0)
+        self.count = 0
+        # false once values were merged and the quantiles are approximate
+        self.exact = True
+
+    def update(self, x):
+        """
+        we will add a chunk of values, nan values are skipped like numpy.nanpercentile does
+        """
+        x = numpy.asarray(x, dtype=float).ravel()
+        x = x[~numpy.isnan(x)]
+        if len(x) == 0:
+            return
+        values, counts = numpy.unique(x, return_counts=True)
+        values, inverse = numpy.unique(numpy.concatenate([self.values, values]), return_inverse=True)
+        self.weights = numpy.bincount(inverse, weights=numpy.concatenate([self.weights, counts]))
+        self.values = values
+        self.count += len(x)
+
+        while len(self.values) > self._max_size:
+            self._compress()
+
+    def _compress(self):
+        """
+        we will merge every pair of neighbouring values into their weighted mean
+        """
+        n = len(self.values) - len(self.values) % 2
+        weights = self.weights[:n].reshape(-1, 2).sum(axis=1)
+        values = (self.values[:n] * self.weights[:n]).reshape(-1, 2).sum(axis=1) / weights
+        self.values = numpy.concatenate([values, self.values[n:]])
+        self.weights = numpy.concatenate([weights, self.weights[n:]])
+        self.exact = False
+
+    def quantile(self, q):
+        """
+        we will return the quantiles like numpy.quantile with the linear method
+        args:
+            q: float or list - the quantiles between 0 and 1
+        returns:
+            numpy.array - the value of every quantile
+        """
+        if self.count == 0:
+            raise ValueError("the sketch has no values.")
+        ranks = (self.count - 1) * numpy.atleast_1d(numpy.asarray(q, dtype=float))
+        # the last rank (0 based) held by every value
+        last = numpy.cumsum(self.weights) - 1
+        low, high = numpy.floor(ranks), numpy.ceil(ranks)
+        low_values = self.values[numpy.searchsorted(last, low, side='left')]
+        high_values = self.values[numpy.searchsorted(last, high, side='left')]
+        return low_values + (ranks - low) * (high_values - low_values)
+
+
+# we will find the Yeo-Johnson lambda of a stream of values. sklearn maximizes the log likelihood
+#     -n/2 * log(var(yeo_johnson(x, lambda))) + (lambda - 1) * sum(sign(x) * log1p(|x|))
+# whose only part that needs all the data is the variance, so we keep the mean and variance of the transformed
+# values for a grid of lambdas and merge them chunk by chunk
+class YeoJohnsonGrid():
+    def __init__(self, lambdas):
+        """
+        we will initialize the accumulators of every lambda of the grid
+        args:
+            lambdas: list - the lambdas we evaluate
+        returns:
+            none
+        """
+        self.lambdas = numpy.asarray(lambdas, dtype=float)
+        self.count = 0
+        self._mean = numpy.zeros(len(self.lambdas))
+        self._m2 = numpy.zeros(len(self.lambdas))
+        self._log_term = 0.0
+
+    def update(self, x):
+        """
+        we will add a chunk of values, the moments are merged with Chan's formula so they stay precise
+        """
+        x = numpy.asarray(x, dtype=float).ravel()
+        x = x[~numpy.isnan(x)]
+        n = len(x)
+        if n == 0:
+            return
+        transformed = numpy.stack([yeo_johnson(x, lmbda) for lmbda in self.lambdas])
+        mean = transformed.mean(axis=1)
+        m2 = ((transformed - mean[:, None]) ** 2).sum(axis=1)
+
+        total = self.count + n
+        delta = mean - self._mean
+        self._mean = self._mean + delta * n / total
+        self._m2 = self._m2 + m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        self._log_term += float((numpy.sign(x) * numpy.log1p(numpy.abs(x))).sum())
+
+    def log_likelihood(self):
+        """
+        we will return the log likelihood of every lambda of the grid
+        """
+        var = self._m2 / self.count
+        with numpy.errstate(divide='ignore'):
+            loglike = -self.count / 2 * numpy.log(var) + (self.lambdas - 1) * self._log_term
+        return numpy.where(var < numpy.finfo(float).tiny, -numpy.inf, loglike)
+
+    def best(self):
+        """
+        we will return the lambda with the highest likelihood and the mean and variance of the values transformed with it
+        returns:
+            float - the lambda
+            float - the mean of the transformed values
+            float - the variance of the transformed values
+        """
+        if self.count == 0:
+            raise ValueError("the grid has no values.")
+        i = int(numpy.argmax(self.log_likelihood()))
+        return float(self.lambdas[i]), float(self._mean[i]), float(self._m2[i] / self.count)
@@ -1,7 +1,12 @@
-from flask import Flask, render_template, request, jsonify
-from database import init_db, save_prediction_data
+from flask import Flask, Response, render_template, request, jsonify
+from database import (init_db, save_prediction_data, save_prediction_batch, is_finite_price,
+                      start_write_behind, write_behind_metrics, query_predictions, summarize_predictions)
+from model_holder import ModelHolder
+from batching import PredictionBatcher
+from prediction_cache import PredictionCache, canonical_key
+import os
+import atexit
 import json
-import joblib
 import pandas as pd
 import numpy
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
@@ -13,6 +18,95 @@ app = Flask(__name__)
 # Initialize database
 init_db()
 
+# load the model and preprocessors once, every request shares them
+# set COMPILED_KERNEL=0 to always serve through the sklearn objects
+# set MODEL_MMAP_MODE=r to memory map the numpy arrays inside the artifacts
+model_holder = ModelHolder(
+    mmap_mode=os.environ.get('MODEL_MMAP_MODE') or None,
+    compile_kernel=os.environ.get('COMPILED_KERNEL', '1') == '1'
+)
+model_holder.load()
+
+# the model input columns in the order the preprocessor was fitted on
+FEATURE_COLUMNS = [
+    'area', 'bedrooms', 'bathrooms', 'stories', 'mainroad', 'guestroom', 'basement',
+    'hotwaterheating', 'airconditioning', 'parking', 'prefarea', 'furnishingstatus'
+]
+
+# the error of a prediction that came out NaN or infinite, e.g. a property outside the target transform's range
+NON_FINITE_PRICE_ERROR = 'the predicted price is not a finite number.'
+
+def parse_features(data):
+    """
+    Convert one JSON object into the feature dict used by the model
+    """
+    if not isinstance(data, dict):
+        raise ValueError('each property must be a JSON object.')
+
+    # Convert data for processing (all radio buttons are 1 for yes, 0 for no)
+    # the preprocessors compare categories as text, so 1 and '1' are one value and share a cache key
+    return {
+        'area': float(data.get('area', 0)),
+        'bedrooms': int(data.get('bedrooms', 0)),
+        'bathrooms': float(data.get('bathrooms', 0)),
+        'stories': int(data.get('stories', 0)),
+        'mainroad': str(data.get('mainroad', 0)),
+        'guestroom': str(data.get('guestroom', 0)),
+        'basement': str(data.get('basement', 0)),
+        'hotwaterheating': str(data.get('hotwaterheating', 0)),
+        'airconditioning': str(data.get('airconditioning', 0)),
+        'parking': int(data.get('parking', 0)),
+        'prefarea': str(data.get('prefarea', 0)),
+        'furnishingstatus': str(data.get('furnishingstatus', 'unfurnished'))
+    }
+
+def _predict_rows(rows):
+    """
+    Predict a list of feature dicts in one vectorized pass, used by the micro-batcher
+    """
+    return make_batch_prediction(pd.DataFrame.from_records(rows, columns=FEATURE_COLUMNS)).tolist()
+
+batcher = None
+
+def start_background_tasks():
+    """
+    Start the artifact watcher and the micro-batcher threads. Threads do not survive a fork,
+    so the prefork server skips this in its master and calls it in every worker instead.
+    """
+    global batcher
+
+    # log predictions through the write-behind buffer, PREDICTION_LOG_WRITE_BEHIND=0 commits inline
+    if os.environ.get('PREDICTION_LOG_WRITE_BEHIND', '1') == '1':
+        start_write_behind(
+            capacity=int(os.environ.get('PREDICTION_LOG_CAPACITY', 10000)),
+            flush_rows=int(os.environ.get('PREDICTION_LOG_FLUSH_ROWS', 500)),
+            flush_ms=float(os.environ.get('PREDICTION_LOG_FLUSH_MS', 200))
+        )
+
+    # reload the artifacts when the files change, MODEL_WATCH_SECONDS=0 turns it off
+    if float(os.environ.get('MODEL_WATCH_SECONDS', 5)) > 0:
+        model_holder.watch(float(os.environ.get('MODEL_WATCH_SECONDS', 5)))
+
+    # optional micro-batching of concurrent /predict calls, enabled with PREDICT_MICROBATCH=1
+    if os.environ.get('PREDICT_MICROBATCH', '0') == '1' and batcher is None:
+        batcher = PredictionBatcher(
+            _predict_rows,
+            max_batch_size=int(os.environ.get('PREDICT_BATCH_SIZE', 64)),
+            max_wait_ms=float(os.environ.get('PREDICT_BATCH_WAIT_MS', 2))
+        ).start()
+        atexit.register(batcher.stop)
+
+if os.environ.get('PREFORK_MASTER', '0') != '1':
+    start_background_tasks()
+
+# cache of recent prices, PREDICTION_CACHE_SIZE=0 turns it off
+prediction_cache = None
+if int(os.environ.get('PREDICTION_CACHE_SIZE', 10000)) > 0:
+    prediction_cache = PredictionCache(
+        max_size=int(os.environ.get('PREDICTION_CACHE_SIZE', 10000)),
+        ttl_seconds=float(os.environ['PREDICTION_CACHE_TTL']) if os.environ.get('PREDICTION_CACHE_TTL') else None
+    )
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -23,27 +117,26 @@ def predict():
         # Get JSON data from request
         data = request.get_json()
         
-        # Convert data for processing (all radio buttons are 1 for yes, 0 for no)
-        features = {
-            'area': float(data.get('area', 0)),
-            'bedrooms': int(data.get('bedrooms', 0)),
-            'bathrooms': float(data.get('bathrooms', 0)),
-            'stories': int(data.get('stories', 0)),
-            'mainroad': data.get('mainroad', 0),
-            'guestroom': data.get('guestroom', 0),
-            'basement': data.get('basement', 0),
-            'hotwaterheating': data.get('hotwaterheating', 0),
-            'airconditioning': data.get('airconditioning', 0),
-            'parking': int(data.get('parking', 0)),
-            'prefarea': data.get('prefarea', 0),
-            'furnishingstatus': data.get('furnishingstatus', 'unfurnished')
-        }
-        
-        # convert to dta frame
-        features = pd.DataFrame(features, index=[0])
+        features = parse_features(data)
+
+        # a cached price skips preprocessing and inference, the request is still logged below
+        predicted_price = None
+        if prediction_cache is not None:
+            cache_key = canonical_key(features, FEATURE_COLUMNS)
+            model_version = model_holder.get().version
+            predicted_price = prediction_cache.get(cache_key, model_version)
 
         # make prediction
-        predicted_price = make_prediction(features)
+        if predicted_price is None:
+            if batcher is not None:
+                predicted_price = batcher.predict(features)
+            else:
+                predicted_price = make_prediction(features)
+            # NaN is not valid JSON and cannot be logged, the request fails instead
+            if not is_finite_price(predicted_price):
+                raise ValueError(NON_FINITE_PRICE_ERROR)
+            if prediction_cache is not None:
+                prediction_cache.put(cache_key, model_version, predicted_price)
         
 
         features['name'] = data.get('name', 'Anonymous')
@@ -63,29 +156,185 @@ def predict():
             'error': str(e)
         }), 400
 
-def make_prediction(features):
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        'model': model_holder.stats(),
+        'batching': batcher.metrics() if batcher is not None else None,
+        'cache': prediction_cache.metrics() if prediction_cache is not None else None,
+        'prediction_log': write_behind_metrics()
+    })
+
+# the largest page /predictions returns
+MAX_PAGE_SIZE = 1000
+
+def _history_filters():
     """
-    Feature Engineering and Model prediction function
+    Read the /predictions filters from the query string
     """
+    args = request.args
+    return {
+        'name': args.get('name'),
+        'created_from': args.get('from'),
+        'created_to': args.get('to'),
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+        'furnishingstatus': args.get('furnishingstatus')
+    }
 
-    # activate all preprocessors and model
-    model = joblib.load('model_linear.pkl')
+@app.route('/predictions')
+def predictions():
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_PAGE_SIZE)
+        rows, next_cursor = query_predictions(limit=limit, cursor=request.args.get('cursor'), **_history_filters())
+        return jsonify({
+            'success': True,
+            'predictions': rows,
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
 
-    # we will preprocess the data
-    preprocessor = joblib.load('preprocessor.pkl')
+@app.route('/predictions/summary')
+def predictions_summary():
+    try:
+        return jsonify({
+            'success': True,
+            'days': summarize_predictions(**_history_filters())
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+def _read_batch_records():
+    """
+    Read the properties of a batch request, either a JSON array or NDJSON (one object per line).
+    NDJSON lines that are not valid JSON are returned as the exception so they fail in place.
+    """
+    if 'ndjson' in (request.mimetype or '') or 'jsonlines' in (request.mimetype or ''):
+        records = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                records.append(e)
+        return records, True
+
+    records = request.get_json()
+    if not isinstance(records, list):
+        raise ValueError('the batch must be a JSON array of properties.')
+    return records, False
+
+def _predict_isolating_errors(features, positions, results):
+    """
+    Predict a whole frame in one vectorized pass. If the pass fails, the frame is halved
+    until the failing rows are found, so one bad row only costs a few extra passes.
+    A row whose price is not a finite number is an error of its own.
+    """
+    try:
+        prices = make_batch_prediction(features)
+    except Exception as e:
+        if len(features) == 1:
+            results[positions[0]] = {'index': positions[0], 'success': False, 'error': str(e)}
+            return
+        middle = len(features) // 2
+        _predict_isolating_errors(features.iloc[:middle], positions[:middle], results)
+        _predict_isolating_errors(features.iloc[middle:], positions[middle:], results)
+        return
+
+    for position, price in zip(positions, prices.tolist()):
+        if is_finite_price(price):
+            results[position] = {'index': position, 'success': True, 'predicted_price': price}
+        else:
+            results[position] = {'index': position, 'success': False, 'error': NON_FINITE_PRICE_ERROR}
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    try:
+        records, ndjson = _read_batch_records()
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    results = [None] * len(records)
+    rows = []
+    positions = []
+    for position, data in enumerate(records):
+        try:
+            if isinstance(data, Exception):
+                raise data
+            rows.append(parse_features(data))
+            positions.append(position)
+        except Exception as e:
+            results[position] = {'index': position, 'success': False, 'error': str(e)}
+
+    if rows:
+        features = pd.DataFrame.from_records(rows, columns=FEATURE_COLUMNS)
+        _predict_isolating_errors(features, positions, results)
+
+    # Save the successful rows to the database in one transaction
+    saved = []
+    for position, row in zip(positions, rows):
+        if results[position]['success']:
+            row['name'] = records[position].get('name', 'Anonymous')
+            row['predicted_price'] = results[position]['predicted_price']
+            saved.append(row)
+    if saved:
+        save_prediction_batch(saved)
+
+    if ndjson:
+        return Response((json.dumps(result) + '\n' for result in results), mimetype='application/x-ndjson')
+
+    return jsonify({
+        'success': True,
+        'count': len(results),
+        'failed': len(results) - len(saved),
+        'results': results
+    })
+
+def make_batch_prediction(features):
+    """
+    Run a frame of properties through the preprocessor, model and target pipeline in one pass
+    and return the predicted prices as a numpy array
+    """
+
+    # all preprocessors and the model are already loaded
+    artifacts = model_holder.get()
+
+    # the compiled kernel gives the same prices without going through sklearn
+    if artifacts.kernel is not None:
+        return numpy.round(artifacts.kernel.predict(features), 2)
 
     # create pipeline for incoming input
-    _data = preprocessor.transform(features)
+    _data = artifacts.preprocessor.transform(features)
 
     # predict house price
-    price = model.predict(_data)
+    price = artifacts.model.predict(_data)
 
-    # we will load the pipeline for the target feature and reverse the scaling
-    pipeline = joblib.load('target_preprocessor.pkl')
-
-    price = pipeline.inverse_transform(price.reshape(-1,1))
+    # we will reverse the scaling of the target feature
+    price = artifacts.target_pipeline.inverse_transform(price.reshape(-1,1))
     
-    return round(float(price[0]), 2)
+    return numpy.round(price.ravel(), 2)
+
+def make_prediction(features):
+    """
+    Feature Engineering and Model prediction function, features is the dict of one property
+    """
+    kernel = model_holder.get().kernel
+    if kernel is not None:
+        return round(kernel.predict_one(features), 2)
+
+    # convert to dta frame
+    return float(make_batch_prediction(pd.DataFrame(features, index=[0]))[0])
 
 
 
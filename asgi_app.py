@@ -0,0 +1,100 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+
+# the Flask module owns the model holder, cache, batcher and feature parsing, we share them
+import app as flask_app
+from database import save_prediction_data, is_finite_price
+
+logger = logging.getLogger(__name__)
+
+# CPU bound inference runs on a bounded pool, SQLite writes on a single writer thread
+inference_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('INFERENCE_WORKERS', os.cpu_count() or 1)),
+    thread_name_prefix='inference'
+)
+database_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prediction-log')
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # finish the queued database writes before the worker exits
+    inference_executor.shutdown(wait=True)
+    database_executor.shutdown(wait=True)
+
+
+app = FastAPI(lifespan=lifespan)
+app.mount('/static', StaticFiles(directory='static'), name='static')
+templates = Jinja2Templates(directory='templates')
+
+
+@app.get('/')
+async def index(request: Request):
+    return templates.TemplateResponse(request, 'index.html')
+
+
+async def _predict_price(features):
+    """Cached price, micro-batched price or a prediction on the inference pool, without blocking the loop"""
+    cache = flask_app.prediction_cache
+    if cache is not None:
+        cache_key = flask_app.canonical_key(features, flask_app.FEATURE_COLUMNS)
+        model_version = flask_app.model_holder.get().version
+        predicted_price = cache.get(cache_key, model_version)
+        if predicted_price is not None:
+            return predicted_price
+
+    if flask_app.batcher is not None:
+        predicted_price = await asyncio.wrap_future(flask_app.batcher.submit(features))
+    else:
+        loop = asyncio.get_running_loop()
+        predicted_price = await loop.run_in_executor(inference_executor, flask_app.make_prediction, features)
+
+    # NaN is not valid JSON and cannot be logged, the request fails instead
+    if not is_finite_price(predicted_price):
+        raise ValueError(flask_app.NON_FINITE_PRICE_ERROR)
+
+    if cache is not None:
+        cache.put(cache_key, model_version, predicted_price)
+    return predicted_price
+
+
+@app.post('/predict')
+async def predict(request: Request):
+    try:
+        # Get JSON data from request
+        data = await request.json()
+
+        features = flask_app.parse_features(data)
+
+        # make prediction
+        predicted_price = await _predict_price(features)
+
+        features['name'] = data.get('name', 'Anonymous')
+
+        # Save to database on the writer thread, the response does not wait for the commit
+        asyncio.get_running_loop().run_in_executor(database_executor, save_prediction_data, features, predicted_price)
+
+        return {
+            'success': True,
+            'predicted_price': predicted_price,
+            'message': 'Prediction completed successfully'
+        }
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=400)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=2662, host='0.0.0.0')
@@ -0,0 +1,137 @@
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class PredictionBatcher:
+    """
+    Coalesces concurrent single predictions into micro-batches.
+    Callers submit one feature dict and wait on a Future, a background thread
+    flushes the queue every max_batch_size rows or max_wait_ms milliseconds
+    (whichever comes first) through one call of predict_batch.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=64, max_wait_ms=2.0):
+        """
+        predict_batch receives a list of feature dicts and returns one price per dict
+        """
+        self._predict_batch = predict_batch
+        self._max_batch_size = max(1, int(max_batch_size))
+        self._max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._last_batch_size = 0
+        self._largest_batch_size = 0
+        self._failed_batches = 0
+
+    def start(self):
+        """Start the flushing thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Flush what is queued and stop the flushing thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, features):
+        """Queue one feature dict, the returned Future resolves to its price"""
+        if self._thread is None:
+            raise RuntimeError("the batcher has not been started.")
+        future = Future()
+        self._queue.put((features, future))
+        return future
+
+    def predict(self, features, timeout=None):
+        """Queue one feature dict and wait for its price"""
+        return self.submit(features).result(timeout)
+
+    def _collect(self, first):
+        """Gather up to max_batch_size items, waiting at most max_wait after the first one"""
+        batch = [first]
+        deadline = time.monotonic() + self._max_wait
+        stop = False
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stop = self._collect(first)
+            self._flush(batch)
+
+        # answer whatever was queued behind the stop marker
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._flush(leftover)
+
+    def _flush(self, batch):
+        features = [item[0] for item in batch]
+        futures = [item[1] for item in batch]
+        try:
+            prices = list(self._predict_batch(features))
+        except Exception:
+            with self._metrics_lock:
+                self._failed_batches += 1
+            # one bad row must not fail its neighbours, so predict them one by one
+            for row, future in zip(features, futures):
+                try:
+                    future.set_result(list(self._predict_batch([row]))[0])
+                except Exception as e:
+                    future.set_exception(e)
+        else:
+            for price, future in zip(prices, futures):
+                future.set_result(price)
+
+        with self._metrics_lock:
+            self._batches += 1
+            self._rows += len(batch)
+            self._last_batch_size = len(batch)
+            self._largest_batch_size = max(self._largest_batch_size, len(batch))
+
+    def metrics(self):
+        """Queue depth and batch size counters"""
+        with self._metrics_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'rows': self._rows,
+                'failed_batches': self._failed_batches,
+                'last_batch_size': self._last_batch_size,
+                'largest_batch_size': self._largest_batch_size,
+                'average_batch_size': round(self._rows / self._batches, 3) if self._batches else 0.0,
+                'max_batch_size': self._max_batch_size,
+                'max_wait_ms': self._max_wait * 1000,
+            }
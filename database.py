@@ -1,38 +1,322 @@
+import os
+import json
+import math
+import base64
+import atexit
 import sqlite3
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+DATABASE_PATH = 'predictions.db'
+
+# applied to every new connection: WAL lets readers run next to the writer and
+# synchronous=NORMAL only fsyncs at checkpoints instead of on every commit
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+)
+
+# columns written for every prediction, in insert order
+PREDICTION_COLUMNS = (
+    'name', 'area', 'bedrooms', 'bathrooms', 'stories', 'mainroad', 'guestroom',
+    'basement', 'hotwaterheating', 'airconditioning', 'parking', 'prefarea',
+    'furnishingstatus', 'predicted_price'
+)
+
+# always executed with this exact string so sqlite3 reuses the prepared statement from its cache
+INSERT_PREDICTION_SQL = f'''
+    INSERT INTO predictions ({', '.join(PREDICTION_COLUMNS)})
+    VALUES ({', '.join('?' * len(PREDICTION_COLUMNS))})
+'''
+
+
+# indexes behind the /predictions filters. the equality filters (name, furnishingstatus) end in created_at,
+# so keyset pagination on (created_at, id) can walk them in order (id is the rowid, stored in every index).
+# the price filter is a range, and no index can both bound a range and return created_at order, so
+# idx_predictions_price only seeks the rows of a min_price/max_price range and SQLite sorts the matches
+# for the page; for a wide range walking idx_predictions_created_at and filtering the price is cheaper
+PREDICTION_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_predictions_created_at ON predictions (created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_predictions_name ON predictions (name, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_predictions_furnishingstatus ON predictions (furnishingstatus, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_predictions_price ON predictions (predicted_price)',
+)
+
+# percentiles reported per day by summarize_predictions
+SUMMARY_PERCENTILES = (50, 90, 99)
+
+
+class ConnectionManager:
+    """
+    Keeps one open SQLite connection per process.
+    Flask runs every request on a fresh thread, so a connection per thread would be
+    reopened on every request; instead threads share the process connection under a lock
+    (SQLite serializes writers anyway). A forked worker notices the pid change and opens its own.
+    """
+
+    def __init__(self, path=DATABASE_PATH):
+        self._path = path
+        self._connection = None
+        self._pid = None
+        self._lock = threading.RLock()
+
+    def _open(self):
+        connection = sqlite3.connect(self._path, check_same_thread=False, cached_statements=256)
+        for pragma in CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Yield the process connection, holding the lock for the duration of the block"""
+        with self._lock:
+            if self._connection is None or self._pid != os.getpid():
+                # never touch a connection inherited from the parent process
+                self._connection = self._open()
+                self._pid = os.getpid()
+            yield self._connection
+
+    @contextmanager
+    def read_connection(self):
+        """Yield a short lived read-only connection, in WAL mode it does not wait for the writer"""
+        connection = sqlite3.connect(f'file:{self._path}?mode=ro', uri=True, check_same_thread=False)
+        try:
+            connection.execute('PRAGMA busy_timeout=5000')
+            connection.row_factory = sqlite3.Row
+            yield connection
+        finally:
+            connection.close()
+
+    def close(self):
+        """Commit and close the connection of this process"""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                try:
+                    self._connection.commit()
+                    self._connection.close()
+                except sqlite3.Error as e:
+                    logger.error(f"Error closing database connection: {str(e)}")
+            self._connection = None
+            self._pid = None
+
+
+connection_manager = ConnectionManager()
+atexit.register(connection_manager.close)
+
+
+def close_db():
+    """Shutdown hook, closes the database connection of this process"""
+    connection_manager.close()
+
+
+def is_finite_price(price):
+    """True when the predicted price can be stored, NaN and infinite prices fail the NOT NULL column"""
+    try:
+        return math.isfinite(price)
+    except TypeError:
+        return False
+
+
+def _insert_rows(manager, rows):
+    """
+    Insert rows of PREDICTION_COLUMNS values in one transaction. When the transaction fails
+    the rows are inserted one by one so only the bad rows are lost, returns (saved, failed)
+    """
+    try:
+        with manager.connection() as conn:
+            with conn:
+                conn.executemany(INSERT_PREDICTION_SQL, rows)
+        return len(rows), 0
+    except Exception as e:
+        logger.warning(f"Batch insert of {len(rows)} predictions failed, retrying row by row: {str(e)}")
+
+    saved = 0
+    with manager.connection() as conn:
+        for row in rows:
+            try:
+                with conn:
+                    conn.execute(INSERT_PREDICTION_SQL, row)
+                saved += 1
+            except Exception as e:
+                logger.error(f"Error saving prediction to database: {str(e)}")
+    return saved, len(rows) - saved
+
+
+class PredictionLogWriter:
+    """
+    Write-behind prediction log. add() appends a row to a bounded in-memory buffer and
+    returns at once, a background thread writes the buffer with executemany in one
+    transaction every flush_rows rows or flush_ms milliseconds.
+    When the buffer is full add() waits up to block_ms for room and then drops the row.
+    Rows with a non-finite predicted price are rejected before they are buffered and a
+    flush that fails is retried row by row, so one bad row never costs the whole flush.
+    """
+
+    def __init__(self, manager=None, capacity=10000, flush_rows=500, flush_ms=200, block_ms=50):
+        self._manager = manager or connection_manager
+        self._capacity = max(1, int(capacity))
+        self._flush_rows = max(1, int(flush_rows))
+        self._flush_seconds = max(0.0, float(flush_ms)) / 1000
+        self._block_seconds = max(0.0, float(block_ms)) / 1000
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._flushed = 0
+        self._dropped = 0
+        self._failed = 0
+        self._rejected = 0
+        self._flushes = 0
+
+    def start(self):
+        """Start the flushing thread"""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='prediction-log-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Write everything still buffered and stop the flushing thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def add(self, row):
+        """Buffer one row of PREDICTION_COLUMNS values, returns False when it had to be dropped"""
+        if not is_finite_price(row[-1]):
+            with self._condition:
+                self._rejected += 1
+            return False
+        with self._condition:
+            if len(self._buffer) >= self._capacity:
+                # backpressure: give the writer a moment to make room before dropping
+                self._condition.wait_for(lambda: len(self._buffer) < self._capacity, self._block_seconds)
+                if len(self._buffer) >= self._capacity:
+                    self._dropped += 1
+                    return False
+            self._buffer.append(row)
+            if len(self._buffer) >= self._flush_rows:
+                self._condition.notify_all()
+            return True
+
+    def _take(self):
+        rows = list(self._buffer)
+        self._buffer.clear()
+        self._condition.notify_all()
+        return rows
+
+    def _write(self, rows):
+        try:
+            saved, failed = _insert_rows(self._manager, rows)
+        except Exception as e:
+            saved, failed = 0, len(rows)
+            logger.error(f"Error flushing {len(rows)} predictions to database: {str(e)}")
+        with self._condition:
+            self._flushed += saved
+            self._failed += failed
+            self._flushes += 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self._flush_seconds
+                while self._running and len(self._buffer) < self._flush_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                running = self._running
+                rows = self._take()
+            if rows:
+                self._write(rows)
+            if not running:
+                break
+
+    def metrics(self):
+        """Buffered, flushed, dropped, failed and rejected row counters"""
+        with self._condition:
+            return {
+                'buffered': len(self._buffer),
+                'capacity': self._capacity,
+                'flushed_rows': self._flushed,
+                'flushes': self._flushes,
+                'dropped_rows': self._dropped,
+                'failed_rows': self._failed,
+                'rejected_rows': self._rejected,
+            }
+
+
+_log_writer = None
+
+
+def start_write_behind(**kwargs):
+    """Send save_prediction_data through a write-behind buffer from now on"""
+    global _log_writer
+    if _log_writer is None:
+        _log_writer = PredictionLogWriter(**kwargs).start()
+        atexit.register(stop_write_behind)
+    return _log_writer
+
+
+def stop_write_behind():
+    """Flush the write-behind buffer and go back to synchronous writes"""
+    global _log_writer
+    writer, _log_writer = _log_writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def write_behind_metrics():
+    """Counters of the write-behind buffer, None when it is not running"""
+    return _log_writer.metrics() if _log_writer is not None else None
+
+
 def init_db():
     """Initialize the SQLite database"""
     try:
-        conn = sqlite3.connect('predictions.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS predictions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                area FLOAT NOT NULL,
-                bedrooms INTEGER NOT NULL,
-                bathrooms REAL NOT NULL,
-                stories INTEGER NOT NULL,
-                mainroad INTEGER NOT NULL,
-                guestroom INTEGER NOT NULL,
-                basement INTEGER NOT NULL,
-                hotwaterheating INTEGER NOT NULL,
-                airconditioning INTEGER NOT NULL,
-                parking INTEGER NOT NULL,
-                prefarea INTEGER NOT NULL,
-                furnishingstatus TEXT NOT NULL,
-                predicted_price REAL NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with connection_manager.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS predictions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    area FLOAT NOT NULL,
+                    bedrooms INTEGER NOT NULL,
+                    bathrooms REAL NOT NULL,
+                    stories INTEGER NOT NULL,
+                    mainroad INTEGER NOT NULL,
+                    guestroom INTEGER NOT NULL,
+                    basement INTEGER NOT NULL,
+                    hotwaterheating INTEGER NOT NULL,
+                    airconditioning INTEGER NOT NULL,
+                    parking INTEGER NOT NULL,
+                    prefarea INTEGER NOT NULL,
+                    furnishingstatus TEXT NOT NULL,
+                    predicted_price REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            for index in PREDICTION_INDEXES:
+                cursor.execute(index)
+
+            conn.commit()
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization error: {str(e)}")
@@ -40,17 +324,12 @@ def init_db():
 
 def save_prediction_data(features, predicted_price):
     """Save prediction data to the database"""
+    if not is_finite_price(predicted_price):
+        logger.warning(f"Prediction data not saved, the predicted price {predicted_price} is not a finite number")
+        return
+
     try:
-        conn = sqlite3.connect('predictions.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO predictions (
-                name, area, bedrooms, bathrooms, stories, mainroad, guestroom,
-                basement, hotwaterheating, airconditioning, parking, prefarea,
-                furnishingstatus, predicted_price
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        row = (
             features['name'],
             features['area'],
             features['bedrooms'],
@@ -65,10 +344,126 @@ def save_prediction_data(features, predicted_price):
             features['prefarea'],
             features['furnishingstatus'],
             predicted_price
-        ))
-        
-        conn.commit()
-        conn.close()
+        )
+
+        # with the write-behind buffer running the commit happens on its thread
+        writer = _log_writer
+        if writer is not None:
+            if not writer.add(row):
+                logger.warning("Prediction log buffer is full, prediction data dropped")
+            return
+
+        with connection_manager.connection() as conn:
+            with conn:
+                conn.execute(INSERT_PREDICTION_SQL, row)
         logger.info("Prediction data saved to database")
     except Exception as e:
         logger.error(f"Error saving to database: {str(e)}")
+
+
+def save_prediction_batch(rows):
+    """
+    Save many predictions to the database in one transaction, each row is a dict of PREDICTION_COLUMNS.
+    Rows with a non-finite price are skipped and a failed transaction is retried row by row,
+    returns the number of rows saved
+    """
+    try:
+        values = [tuple(row[column] for column in PREDICTION_COLUMNS) for row in rows]
+        finite = [row for row in values if is_finite_price(row[-1])]
+        if len(finite) < len(values):
+            logger.warning(f"{len(values) - len(finite)} predictions not saved, their predicted price is not a finite number")
+        saved, _ = _insert_rows(connection_manager, finite) if finite else (0, 0)
+        logger.info(f"{saved} predictions saved to database")
+        return saved
+    except Exception as e:
+        logger.error(f"Error saving batch to database: {str(e)}")
+        return 0
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque pagination cursor pointing after the row (created_at, row_id)"""
+    return base64.urlsafe_b64encode(json.dumps([created_at, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Read a cursor made by encode_cursor, raises ValueError when it is malformed"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError("the cursor is invalid.")
+
+
+def _prediction_filters(name=None, created_from=None, created_to=None, min_price=None, max_price=None,
+                        furnishingstatus=None):
+    """Build the WHERE clause and parameters shared by the history queries"""
+    clauses = []
+    params = []
+    for clause, value in (('name = ?', name),
+                          ('created_at >= ?', created_from),
+                          ('created_at < ?', created_to),
+                          ('predicted_price >= ?', min_price),
+                          ('predicted_price <= ?', max_price),
+                          ('furnishingstatus = ?', furnishingstatus)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    return clauses, params
+
+
+def query_predictions(limit=100, cursor=None, **filters):
+    """
+    Newest first page of predictions matching the filters (name, created_from, created_to,
+    min_price, max_price, furnishingstatus). Pages are keyset based: pass the returned
+    cursor to get the next page, no OFFSET scan is ever done.
+    Returns (rows, next_cursor), next_cursor is None on the last page.
+    """
+    clauses, params = _prediction_filters(**filters)
+    if cursor is not None:
+        created_at, row_id = decode_cursor(cursor)
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend([created_at, row_id])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    with connection_manager.read_connection() as conn:
+        rows = conn.execute(
+            f"SELECT id, {', '.join(PREDICTION_COLUMNS)}, created_at FROM predictions {where} "
+            f"ORDER BY created_at DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+    rows = [dict(row) for row in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def summarize_predictions(**filters):
+    """
+    Per day count, average, minimum, maximum and nearest-rank percentiles of predicted_price
+    for the predictions matching the filters, computed inside SQLite with window functions
+    """
+    clauses, params = _prediction_filters(**filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    percentiles = ', '.join(
+        f"MAX(CASE WHEN rank = MAX(1, (total * {p} + 99) / 100) THEN predicted_price END) AS p{p}"
+        for p in SUMMARY_PERCENTILES
+    )
+
+    with connection_manager.read_connection() as conn:
+        rows = conn.execute(f'''
+            WITH ranked AS (
+                SELECT date(created_at) AS day, predicted_price,
+                       ROW_NUMBER() OVER (PARTITION BY date(created_at) ORDER BY predicted_price) AS rank,
+                       COUNT(*) OVER (PARTITION BY date(created_at)) AS total
+                FROM predictions {where}
+            )
+            SELECT day, COUNT(*) AS count, AVG(predicted_price) AS avg_price,
+                   MIN(predicted_price) AS min_price, MAX(predicted_price) AS max_price, {percentiles}
+            FROM ranked
+            GROUP BY day
+            ORDER BY day
+        ''', params).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import tracemalloc
+import logging
+import joblib
+from model_kernel import compile_model
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = 'model_linear.pkl'
+PREPROCESSOR_PATH = 'preprocessor.pkl'
+TARGET_PREPROCESSOR_PATH = 'target_preprocessor.pkl'
+# written by the model evaluation, names the published set of the three artifacts (see publish_serving_artifacts)
+SERVING_POINTER_PATH = 'serving.json'
+
+
+class ModelArtifacts:
+    """Loaded model, preprocessor and target pipeline, never mutated after loading"""
+
+    def __init__(self, model, preprocessor, target_pipeline, version, load_seconds, memory_bytes, kernel=None):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.target_pipeline = target_pipeline
+        # flat NumPy kernel of the three artifacts, None when they can not be compiled
+        self.kernel = kernel
+        self.version = version
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.loaded_at = time.time()
+
+
+def _file_signature(paths):
+    """Build a version string from the size and modification time of the artifact files"""
+    digest = hashlib.md5()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def resolve_artifact_paths(pointer_path, default_paths):
+    """Paths of the model, preprocessor and target pipeline named by the pointer file, the defaults without one"""
+    if pointer_path is None or not os.path.exists(pointer_path):
+        return tuple(default_paths)
+    with open(pointer_path) as f:
+        pointer = json.load(f)
+    root = os.path.dirname(pointer_path)
+    return tuple(os.path.join(root, pointer[name]) for name in ('model', 'preprocessor', 'target_preprocessor'))
+
+
+def _output_width(preprocessor):
+    """Number of columns the fitted preprocessor produces, None if it can not be told"""
+    try:
+        return len(preprocessor.get_feature_names_out())
+    except Exception:
+        return None
+
+
+def check_compatibility(model, preprocessor, target_pipeline):
+    """Make sure the three artifacts can be chained together"""
+    for name, obj, method in (('model', model, 'predict'),
+                              ('preprocessor', preprocessor, 'transform'),
+                              ('target preprocessor', target_pipeline, 'inverse_transform')):
+        if not hasattr(obj, method):
+            raise ValueError(f"the {name} has no {method} method.")
+
+    if not hasattr(preprocessor, 'n_features_in_'):
+        raise ValueError("the preprocessor has not been fitted.")
+
+    model_width = getattr(model, 'n_features_in_', None)
+    preprocessor_width = _output_width(preprocessor)
+    if model_width is not None and preprocessor_width is not None and model_width != preprocessor_width:
+        raise ValueError(
+            f"the preprocessor produces {preprocessor_width} features but the model expects {model_width}."
+        )
+
+    target_width = getattr(target_pipeline, 'n_features_in_', 1)
+    if target_width != 1:
+        raise ValueError(f"the target preprocessor expects {target_width} columns instead of 1.")
+
+
+class ModelHolder:
+    """
+    Keeps the model artifacts loaded once per process.
+    Request handlers call get() and read the returned ModelArtifacts without locking,
+    a reload builds a new ModelArtifacts and swaps the reference in one assignment.
+    The artifacts come from the set the pointer file names, switching the pointer
+    publishes a new set at once. Without a pointer file the three paths are served.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, preprocessor_path=PREPROCESSOR_PATH,
+                 target_preprocessor_path=TARGET_PREPROCESSOR_PATH, mmap_mode=None, compile_kernel=True,
+                 pointer_path=SERVING_POINTER_PATH):
+        self._paths = (model_path, preprocessor_path, target_preprocessor_path)
+        self._pointer_path = pointer_path
+        self._mmap_mode = mmap_mode
+        self._compile_kernel = compile_kernel
+        self._artifacts = None
+        self._load_lock = threading.Lock()
+        self._watcher = None
+
+    def load(self):
+        """Load all artifacts from disk, check them and publish them to the request handlers"""
+        with self._load_lock:
+            paths = resolve_artifact_paths(self._pointer_path, self._paths)
+            version = _file_signature(paths)
+
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            memory_before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                model, preprocessor, target_pipeline = (
+                    joblib.load(path, mmap_mode=self._mmap_mode) for path in paths
+                )
+                load_seconds = time.perf_counter() - start
+                memory_bytes = tracemalloc.get_traced_memory()[0] - memory_before
+            finally:
+                if not tracing:
+                    tracemalloc.stop()
+
+            check_compatibility(model, preprocessor, target_pipeline)
+
+            kernel = None
+            if self._compile_kernel:
+                try:
+                    kernel = compile_model(model, preprocessor, target_pipeline)
+                except TypeError as e:
+                    logger.info(f"Serving with the sklearn pipeline, the artifacts can not be compiled: {e}")
+
+            self._artifacts = ModelArtifacts(model, preprocessor, target_pipeline, version,
+                                             load_seconds, max(memory_bytes, 0), kernel)
+            logger.info(
+                f"Model artifacts loaded in {load_seconds * 1000:.1f} ms "
+                f"using {memory_bytes / 1024:.1f} KiB (version {version})"
+            )
+            return self._artifacts
+
+    def get(self):
+        """Return the current artifacts, loading them on first use"""
+        artifacts = self._artifacts
+        if artifacts is None:
+            artifacts = self.load()
+        return artifacts
+
+    def reload_if_changed(self):
+        """Reload the artifacts when any of the files changed on disk, returns True on reload"""
+        artifacts = self._artifacts
+        if artifacts is not None and \
+                artifacts.version == _file_signature(resolve_artifact_paths(self._pointer_path, self._paths)):
+            return False
+        self.load()
+        return True
+
+    def watch(self, interval_seconds=5.0):
+        """Check the artifact files every interval_seconds in a background thread and reload on change"""
+        def _watch():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    if self.reload_if_changed():
+                        logger.info("Model artifacts changed on disk and were reloaded")
+                except Exception as e:
+                    # keep serving the artifacts we have, the files may be half written
+                    logger.error(f"Model artifact reload failed: {str(e)}")
+
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=_watch, name='model-watcher', daemon=True)
+            self._watcher.start()
+
+    def stats(self):
+        """Load time, memory footprint and version of the current artifacts"""
+        artifacts = self._artifacts
+        if artifacts is None:
+            return {'loaded': False}
+        return {
+            'loaded': True,
+            'version': artifacts.version,
+            'load_seconds': round(artifacts.load_seconds, 6),
+            'memory_bytes': artifacts.memory_bytes,
+            'loaded_at': artifacts.loaded_at,
+            'compiled_kernel': artifacts.kernel is not None,
+        }
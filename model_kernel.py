@@ -0,0 +1,424 @@
+import math
+import logging
+import numpy
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import (OneHotEncoder, PowerTransformer, RobustScaler,
+                                   StandardScaler, FunctionTransformer)
+
+from _src.categorical_encoding import DictionaryEncoder
+# the array form of the Yeo-Johnson transform is shared with the streaming fit of the feature engineering
+from _src.streaming_statistics import yeo_johnson as _yeo_johnson
+
+logger = logging.getLogger(__name__)
+
+KERNEL_PATH = 'model_kernel.npz'
+
+_EPS = numpy.spacing(1.0)
+
+
+def _yeo_johnson_scalar(x, lmbda):
+    """Yeo-Johnson forward transform of a single float"""
+    if x >= 0:
+        if abs(lmbda) < _EPS:
+            return math.log1p(x)
+        return math.expm1(lmbda * math.log1p(x)) / lmbda
+    if abs(lmbda - 2) > _EPS:
+        return -math.expm1((2 - lmbda) * math.log1p(-x)) / (2 - lmbda)
+    return -math.log1p(-x)
+
+
+def _yeo_johnson_inverse(y, lmbda):
+    """Yeo-Johnson inverse transform of a float array, same branches as sklearn"""
+    out = numpy.empty_like(y)
+    pos = y >= 0
+    if abs(lmbda) < _EPS:
+        out[pos] = numpy.exp(y[pos]) - 1
+    else:
+        out[pos] = numpy.power(y[pos] * lmbda + 1, 1 / lmbda) - 1
+    if abs(lmbda - 2) > _EPS:
+        out[~pos] = 1 - numpy.power(-(2 - lmbda) * y[~pos] + 1, 1 / (2 - lmbda))
+    else:
+        out[~pos] = 1 - numpy.exp(-y[~pos])
+    return out
+
+
+def _power_scalar(base, exponent):
+    """base ** exponent of two floats like numpy.power: nan instead of a complex for a negative base, inf for 0 ** -x"""
+    if base < 0 and not float(exponent).is_integer():
+        return math.nan
+    if base == 0 and exponent < 0:
+        return math.inf
+    return base ** exponent
+
+
+def _yeo_johnson_inverse_scalar(y, lmbda):
+    """Yeo-Johnson inverse transform of a single float"""
+    if y >= 0:
+        if abs(lmbda) < _EPS:
+            return math.exp(y) - 1
+        return _power_scalar(y * lmbda + 1, 1 / lmbda) - 1
+    if abs(lmbda - 2) > _EPS:
+        return 1 - _power_scalar(-(2 - lmbda) * y + 1, 1 / (2 - lmbda))
+    return 1 - math.exp(-y)
+
+
+def _scaler_params(scaler, width):
+    """Return (center, scale) arrays of a fitted StandardScaler or RobustScaler"""
+    if isinstance(scaler, RobustScaler):
+        center, scale = scaler.center_, scaler.scale_
+    else:
+        center, scale = scaler.mean_, scaler.scale_
+    center = numpy.zeros(width) if center is None else numpy.asarray(center, dtype=float)
+    scale = numpy.ones(width) if scale is None else numpy.asarray(scale, dtype=float)
+    return center, scale
+
+
+def _resolve_columns(columns, feature_names):
+    """Turn the column selector of a ColumnTransformer branch into input positions"""
+    positions = {name: i for i, name in enumerate(feature_names)}
+    if isinstance(columns, slice):
+        return list(range(len(feature_names)))[columns]
+    columns = list(numpy.atleast_1d(columns)) if not isinstance(columns, (list, tuple)) else list(columns)
+    if columns and isinstance(columns[0], (bool, numpy.bool_)):
+        return [i for i, keep in enumerate(columns) if keep]
+    return [positions[c] if isinstance(c, str) else int(c) for c in columns]
+
+
+def _unwrap_model(model):
+    """Return the fitted linear estimator behind a search object"""
+    model = getattr(model, 'best_estimator_', model)
+    if not hasattr(model, 'coef_') or not hasattr(model, 'intercept_'):
+        raise TypeError(f"{type(model).__name__} is not a linear model and can not be compiled.")
+    return model
+
+
+class LinearKernel:
+    """
+    Flat NumPy version of preprocessor -> linear model -> target inverse transform.
+    The preprocessing is folded into the model coefficients so a prediction is
+        z = intercept + X_num . linear_coef + yeo_johnson(X_num[:, power_index]) . power_coef
+            + sum of the one hot contributions of every categorical column
+    followed by the inverse of the target pipeline.
+    """
+
+    def __init__(self, feature_names, intercept, linear_coef, power_index, power_lambda, power_coef,
+                 categorical_index, categorical_vocab, categorical_table, categorical_ignore_unknown,
+                 target_steps):
+        self.feature_names = list(feature_names)
+        self.intercept = float(intercept)
+        self.linear_coef = numpy.asarray(linear_coef, dtype=float)
+        self.power_index = numpy.asarray(power_index, dtype=numpy.intp)
+        self.power_lambda = numpy.asarray(power_lambda, dtype=float)
+        self.power_coef = numpy.asarray(power_coef, dtype=float)
+        self.categorical_index = [int(i) for i in categorical_index]
+        self.categorical_vocab = [[str(v) for v in vocab] for vocab in categorical_vocab]
+        self.categorical_table = [numpy.asarray(table, dtype=float) for table in categorical_table]
+        self.categorical_ignore_unknown = [bool(flag) for flag in categorical_ignore_unknown]
+        # list of ('scale', center, scale) and ('yeo-johnson', lambda, mean, scale) in forward order
+        self.target_steps = list(target_steps)
+
+        categorical = set(self.categorical_index)
+        self.numeric_index = [i for i in range(len(self.feature_names)) if i not in categorical]
+        self._lookups = [dict(zip(vocab, table.tolist()))
+                         for vocab, table in zip(self.categorical_vocab, self.categorical_table)]
+        # per numeric position: (linear coefficient, [(lambda, coefficient), ...])
+        self._scalar_terms = []
+        power = {}
+        for position, lmbda, coef in zip(self.power_index.tolist(), self.power_lambda.tolist(),
+                                         self.power_coef.tolist()):
+            power.setdefault(position, []).append((lmbda, coef))
+        for position, coef in enumerate(self.linear_coef.tolist()):
+            self._scalar_terms.append((self.numeric_index[position], coef, power.get(position, [])))
+
+    def _categorical_contribution(self, values, column):
+        """Sum of the one hot coefficients of a column, looked up once per distinct value"""
+        uniques, inverse = numpy.unique(numpy.asarray(values).astype(str), return_inverse=True)
+        lookup = self._lookups[column]
+        codes = numpy.empty(len(uniques))
+        for i, value in enumerate(uniques.tolist()):
+            if value in lookup:
+                codes[i] = lookup[value]
+            elif self.categorical_ignore_unknown[column]:
+                codes[i] = 0.0
+            else:
+                raise ValueError(
+                    f"Found unknown categories ['{value}'] in column "
+                    f"'{self.feature_names[self.categorical_index[column]]}'"
+                )
+        return numpy.take(codes, inverse.ravel())
+
+    def _inverse_target(self, z):
+        for step in reversed(self.target_steps):
+            if step[0] == 'scale':
+                _, center, scale = step
+                z = z * scale + center
+            else:
+                _, lmbda, mean, scale = step
+                z = _yeo_johnson_inverse(z * scale + mean, lmbda)
+        return z
+
+    def _inverse_target_scalar(self, z):
+        for step in reversed(self.target_steps):
+            if step[0] == 'scale':
+                _, center, scale = step
+                z = z * scale + center
+            else:
+                _, lmbda, mean, scale = step
+                z = _yeo_johnson_inverse_scalar(z * scale + mean, lmbda)
+        return z
+
+    def predict(self, X):
+        """
+        Predict prices for many properties
+        args:
+            X - a DataFrame with the raw feature columns, a list of feature dicts or a 2D array in feature_names order
+        returns:
+            numpy.ndarray - the predicted prices
+        """
+        if len(X) == 0:
+            return numpy.empty(0)
+        if isinstance(X, pd.DataFrame):
+            columns = [X[name].to_numpy() for name in self.feature_names]
+        elif len(X) and isinstance(X[0], dict):
+            columns = [numpy.array([record[name] for record in X], dtype=object) for name in self.feature_names]
+        else:
+            X = numpy.asarray(X, dtype=object)
+            columns = [X[:, i] for i in range(X.shape[1])]
+
+        numeric = numpy.column_stack([columns[i].astype(float) for i in self.numeric_index])
+        z = numpy.full(len(numeric), self.intercept)
+        z += numeric @ self.linear_coef
+        for position, lmbda, coef in zip(self.power_index, self.power_lambda, self.power_coef):
+            z += coef * _yeo_johnson(numeric[:, position], lmbda)
+        for column, position in enumerate(self.categorical_index):
+            z += self._categorical_contribution(columns[position], column)
+        return self._inverse_target(z)
+
+    def predict_one(self, record):
+        """
+        Predict the price of a single property with plain float math
+        args:
+            record: dict - the raw features of one property
+        returns:
+            float - the predicted price
+        """
+        names = self.feature_names
+        z = self.intercept
+        for position, coef, power_terms in self._scalar_terms:
+            x = float(record[names[position]])
+            z += coef * x
+            for lmbda, power_coef in power_terms:
+                z += power_coef * _yeo_johnson_scalar(x, lmbda)
+        for column, position in enumerate(self.categorical_index):
+            value = str(record[names[position]])
+            lookup = self._lookups[column]
+            if value in lookup:
+                z += lookup[value]
+            elif not self.categorical_ignore_unknown[column]:
+                raise ValueError(f"Found unknown categories ['{value}'] in column '{names[position]}'")
+        return self._inverse_target_scalar(z)
+
+    def save(self, path=KERNEL_PATH):
+        """Write the kernel arrays to a .npz file"""
+        arrays = {
+            'feature_names': numpy.array(self.feature_names, dtype=str),
+            'intercept': numpy.array(self.intercept),
+            'linear_coef': self.linear_coef,
+            'power_index': self.power_index,
+            'power_lambda': self.power_lambda,
+            'power_coef': self.power_coef,
+            'categorical_index': numpy.array(self.categorical_index, dtype=numpy.intp),
+            'categorical_ignore_unknown': numpy.array(self.categorical_ignore_unknown, dtype=bool),
+            'target_kinds': numpy.array([step[0] for step in self.target_steps], dtype=str),
+        }
+        for i, (vocab, table) in enumerate(zip(self.categorical_vocab, self.categorical_table)):
+            arrays[f'categorical_vocab_{i}'] = numpy.array(vocab, dtype=str)
+            arrays[f'categorical_table_{i}'] = table
+        for i, step in enumerate(self.target_steps):
+            arrays[f'target_params_{i}'] = numpy.array(step[1:], dtype=float)
+        numpy.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path=KERNEL_PATH):
+        """Read a kernel written by save()"""
+        with numpy.load(path, allow_pickle=False) as data:
+            n_categorical = len(data['categorical_index'])
+            target_steps = [(str(kind), *data[f'target_params_{i}'].tolist())
+                            for i, kind in enumerate(data['target_kinds'])]
+            return cls(
+                feature_names=data['feature_names'].tolist(),
+                intercept=float(data['intercept']),
+                linear_coef=data['linear_coef'],
+                power_index=data['power_index'],
+                power_lambda=data['power_lambda'],
+                power_coef=data['power_coef'],
+                categorical_index=data['categorical_index'].tolist(),
+                categorical_vocab=[data[f'categorical_vocab_{i}'].tolist() for i in range(n_categorical)],
+                categorical_table=[data[f'categorical_table_{i}'] for i in range(n_categorical)],
+                categorical_ignore_unknown=data['categorical_ignore_unknown'].tolist(),
+                target_steps=target_steps,
+            )
+
+
+def _compile_target(target_pipeline):
+    """Turn the fitted target pipeline into a list of kernel steps"""
+    steps = target_pipeline.steps if isinstance(target_pipeline, Pipeline) else [('target', target_pipeline)]
+    kernel_steps = []
+    for name, step in steps:
+        if step is None or step == 'passthrough':
+            continue
+        if isinstance(step, (RobustScaler, StandardScaler)):
+            center, scale = _scaler_params(step, 1)
+            kernel_steps.append(('scale', float(center[0]), float(scale[0])))
+        elif isinstance(step, PowerTransformer) and step.method == 'yeo-johnson':
+            mean, scale = (_scaler_params(step._scaler, 1) if step.standardize
+                           else (numpy.zeros(1), numpy.ones(1)))
+            kernel_steps.append(('yeo-johnson', float(step.lambdas_[0]), float(mean[0]), float(scale[0])))
+        else:
+            raise TypeError(f"target step '{name}' ({type(step).__name__}) can not be compiled.")
+    return kernel_steps
+
+
+def compile_model(model, preprocessor, target_pipeline):
+    """
+    Fold the fitted preprocessor, the linear model and the target pipeline into one LinearKernel
+    args:
+        model - the fitted LinearRegression (or a search object wrapping one)
+        preprocessor: ColumnTransformer - the fitted feature preprocessor
+        target_pipeline - the fitted target preprocessor
+    returns:
+        LinearKernel - raises TypeError when a step can not be folded
+    """
+    if not isinstance(preprocessor, ColumnTransformer):
+        raise TypeError("only a ColumnTransformer preprocessor can be compiled.")
+    estimator = _unwrap_model(model)
+    coef = numpy.asarray(estimator.coef_, dtype=float).ravel()
+    intercept = float(numpy.ravel(estimator.intercept_)[0])
+
+    feature_names = list(preprocessor.feature_names_in_)
+    n_features = len(feature_names)
+    linear = numpy.zeros(n_features)
+    power_terms = []
+    categorical = {}
+
+    offset = 0
+    for name, transformer, columns in preprocessor.transformers_:
+        positions = _resolve_columns(columns, feature_names)
+        if transformer == 'drop' or not positions:
+            continue
+        if transformer == 'passthrough' or (isinstance(transformer, FunctionTransformer) and transformer.func is None):
+            width = len(positions)
+            linear[positions] += coef[offset:offset + width]
+        elif isinstance(transformer, (RobustScaler, StandardScaler)):
+            width = len(positions)
+            center, scale = _scaler_params(transformer, width)
+            branch = coef[offset:offset + width] / scale
+            linear[positions] += branch
+            intercept -= float(branch @ center)
+        elif isinstance(transformer, PowerTransformer) and transformer.method == 'yeo-johnson':
+            width = len(positions)
+            mean, scale = (_scaler_params(transformer._scaler, width) if transformer.standardize
+                           else (numpy.zeros(width), numpy.ones(width)))
+            branch = coef[offset:offset + width] / scale
+            intercept -= float(branch @ mean)
+            power_terms.extend(zip(positions, transformer.lambdas_.tolist(), branch.tolist()))
+        elif isinstance(transformer, OneHotEncoder):
+            infrequent = getattr(transformer, '_infrequent_enabled', False)
+            if transformer.drop_idx_ is not None or infrequent:
+                raise TypeError(f"branch '{name}' uses dropped or infrequent categories and can not be compiled.")
+            width = 0
+            for position, categories in zip(positions, transformer.categories_):
+                table = coef[offset + width:offset + width + len(categories)]
+                vocab, _ = categorical.setdefault(position, ({}, transformer.handle_unknown != 'error'))
+                for category, value in zip(categories.tolist(), table.tolist()):
+                    vocab[str(category)] = vocab.get(str(category), 0.0) + value
+                width += len(categories)
+        elif isinstance(transformer, DictionaryEncoder):
+            # every accepted spelling of a value gets the coefficient of its category
+            onehot = transformer.output == 'onehot'
+            width = 0
+            for position, categories, lookup in zip(positions, transformer.categories_, transformer.lookups_):
+                vocab, _ = categorical.setdefault(position, ({}, transformer.handle_unknown == 'ignore'))
+                for key, code in lookup.items():
+                    value = coef[offset + width + code] if onehot else coef[offset + width] * code
+                    vocab[key] = vocab.get(key, 0.0) + float(value)
+                width += len(categories) if onehot else 1
+        else:
+            raise TypeError(f"branch '{name}' ({type(transformer).__name__}) can not be compiled.")
+        offset += width
+
+    if offset != len(coef):
+        raise ValueError(f"the preprocessor produces {offset} features but the model has {len(coef)} coefficients.")
+
+    categorical_index = sorted(categorical)
+    numeric_index = [i for i in range(n_features) if i not in categorical]
+    numeric_position = {position: i for i, position in enumerate(numeric_index)}
+    power_terms = [(numeric_position[p], lmbda, c) for p, lmbda, c in power_terms]
+
+    return LinearKernel(
+        feature_names=feature_names,
+        intercept=intercept,
+        linear_coef=linear[numeric_index],
+        power_index=[p for p, _, _ in power_terms],
+        power_lambda=[lmbda for _, lmbda, _ in power_terms],
+        power_coef=[c for _, _, c in power_terms],
+        categorical_index=categorical_index,
+        categorical_vocab=[list(categorical[i][0]) for i in categorical_index],
+        categorical_table=[list(categorical[i][0].values()) for i in categorical_index],
+        categorical_ignore_unknown=[categorical[i][1] for i in categorical_index],
+        target_steps=_compile_target(target_pipeline),
+    )
+
+
+def _max_difference(actual, expected):
+    """Largest absolute difference of two arrays, where both being nan counts as no difference"""
+    both_nan = numpy.isnan(actual) & numpy.isnan(expected)
+    return float(numpy.max(numpy.where(both_nan, 0.0, numpy.abs(actual - expected)), initial=0.0))
+
+
+def verify_kernel(kernel, model, preprocessor, target_pipeline, X, rtol=1e-9, atol=1e-6):
+    """
+    Check the kernel against the sklearn path on a sample frame, raises ValueError on mismatch.
+    Both the array path (predict) and the scalar path (predict_one) are checked on every row, and the target
+    inverse is also checked on model outputs far outside the training range, where the Yeo-Johnson
+    inverse has no real value and sklearn gives nan
+    """
+    expected = target_pipeline.inverse_transform(
+        numpy.asarray(model.predict(preprocessor.transform(X))).reshape(-1, 1)
+    ).ravel()
+    checks = [('predict', kernel.predict(X), expected)]
+    if len(X):
+        checks.append(('predict_one', numpy.array([kernel.predict_one(record) for record in X.to_dict('records')]),
+                       expected))
+
+    z = numpy.linspace(-50.0, 50.0, 201)
+    out_of_range = target_pipeline.inverse_transform(z.reshape(-1, 1)).ravel()
+    checks.append(('target inverse', kernel._inverse_target(z), out_of_range))
+    checks.append(('scalar target inverse', numpy.array([kernel._inverse_target_scalar(v) for v in z.tolist()]),
+                   out_of_range))
+
+    for name, actual, wanted in checks:
+        if not numpy.allclose(actual, wanted, rtol=rtol, atol=atol, equal_nan=True):
+            raise ValueError(f"the compiled kernel ({name}) differs from the sklearn pipeline by up to "
+                             f"{_max_difference(actual, wanted)}.")
+    return _max_difference(checks[0][1], expected) if len(X) else 0.0
+
+
+if __name__ == '__main__':
+    import joblib
+    from _src.data_splitting import read_split
+    from model_holder import MODEL_PATH, PREPROCESSOR_PATH, TARGET_PREPROCESSOR_PATH, SERVING_POINTER_PATH, \
+        resolve_artifact_paths
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # the artifacts the app serves
+    model, preprocessor, target_pipeline = (joblib.load(path) for path in resolve_artifact_paths(
+        SERVING_POINTER_PATH, (MODEL_PATH, PREPROCESSOR_PATH, TARGET_PREPROCESSOR_PATH)))
+
+    kernel = compile_model(model, preprocessor, target_pipeline)
+    error = verify_kernel(kernel, model, preprocessor, target_pipeline,
+                          read_split('x_test'))
+    kernel.save(KERNEL_PATH)
+    logger.info(f"compiled kernel saved to {KERNEL_PATH} (max abs error {error:.3g})")
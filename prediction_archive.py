@@ -0,0 +1,182 @@
+import os
+import glob
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from database import connection_manager, PREDICTION_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = 'data/predictions_archive'
+
+# the yes/no columns hold 1/0 from the form or 'yes'/'no' from older clients, the archive keeps them as text
+_FLAG_COLUMNS = ('mainroad', 'guestroom', 'basement', 'hotwaterheating', 'airconditioning', 'prefarea')
+
+# PREDICTION_COLUMNS order with the id and the timestamp around it
+_ARCHIVE_COLUMNS = ['id', *PREDICTION_COLUMNS, 'created_at']
+
+_ARCHIVE_TYPES = {
+    'id': pa.int64(), 'name': pa.string(), 'area': pa.float64(), 'bedrooms': pa.int64(),
+    'bathrooms': pa.float64(), 'stories': pa.int64(), 'parking': pa.int64(),
+    'furnishingstatus': pa.string(), 'predicted_price': pa.float64(), 'created_at': pa.timestamp('s'),
+    **{column: pa.string() for column in _FLAG_COLUMNS}
+}
+
+ARCHIVE_SCHEMA = pa.schema([(column, _ARCHIVE_TYPES[column]) for column in _ARCHIVE_COLUMNS])
+
+
+def _to_archive_frame(df):
+    """Give rows read from SQLite the archive column types"""
+    df = df[_ARCHIVE_COLUMNS].copy()
+    for column in _FLAG_COLUMNS:
+        df[column] = df[column].astype(str)
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    return df
+
+
+def _write_partition(df, day, archive_dir):
+    """Write the rows of one day as a parquet part named after its id range, replacing a previous attempt"""
+    partition = os.path.join(archive_dir, f'day={day}')
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, f"part-{int(df['id'].min())}-{int(df['id'].max())}.parquet")
+    table = pa.Table.from_pandas(df, schema=ARCHIVE_SCHEMA, preserve_index=False)
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def _drop_duplicate_ids(table):
+    """Keep one row of every id of a table sorted by id, a retried batch or an interrupted compaction repeats rows"""
+    ids = table.column('id').to_numpy()
+    if len(ids) < 2:
+        return table
+    return table.filter(pa.array(numpy.concatenate(([True], ids[1:] != ids[:-1]))))
+
+
+def compact_archive(archive_dir=ARCHIVE_DIR, min_files=4):
+    """Merge the parts of every day that has at least min_files of them into one file without duplicate ids"""
+    merged = 0
+    for partition in sorted(glob.glob(os.path.join(archive_dir, 'day=*'))):
+        parts = sorted(glob.glob(os.path.join(partition, 'part-*.parquet')))
+        if len(parts) < min_files:
+            continue
+        table = pa.concat_tables([pq.read_table(part, schema=ARCHIVE_SCHEMA) for part in parts]).sort_by('id')
+        table = _drop_duplicate_ids(table)
+        ids = table.column('id')
+        path = os.path.join(partition, f"part-{pc.min(ids).as_py()}-{pc.max(ids).as_py()}.parquet")
+        pq.write_table(table, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+        for part in parts:
+            if part != path:
+                os.remove(part)
+        merged += 1
+    return merged
+
+
+def roll_over(retention_days=30, batch_rows=100000, archive_dir=ARCHIVE_DIR, vacuum=True):
+    """
+    Move the predictions older than retention_days from SQLite into day partitioned parquet files,
+    then compact the archive and reclaim the freed space of the live database.
+    Every batch is written before it is deleted, so an interrupted roll over can simply be run again.
+    A retried batch may cover other ids than the first attempt, the rows both parts hold are
+    dropped again by compact_archive and read_predictions.
+    returns:
+        int - the number of rows moved
+    """
+    # created_at is filled by CURRENT_TIMESTAMP, which is UTC
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+    moved = 0
+    while True:
+        with connection_manager.read_connection() as conn:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(_ARCHIVE_COLUMNS)} FROM predictions WHERE created_at < ? ORDER BY id LIMIT ?",
+                conn, params=(cutoff, batch_rows)
+            )
+        if df.empty:
+            break
+
+        df = _to_archive_frame(df)
+        for day, rows in df.groupby(df['created_at'].dt.strftime('%Y-%m-%d')):
+            _write_partition(rows, day, archive_dir)
+
+        with connection_manager.connection() as conn:
+            with conn:
+                conn.execute('DELETE FROM predictions WHERE created_at < ? AND id <= ?',
+                             (cutoff, int(df['id'].max())))
+        moved += len(df)
+        logger.info(f"Archived {moved} predictions older than {cutoff}")
+
+    compact_archive(archive_dir)
+
+    if vacuum and moved:
+        with connection_manager.connection() as conn:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.execute('VACUUM')
+    return moved
+
+
+def read_predictions(created_from=None, created_to=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """
+    Read predictions from the parquet archive and the live database as one DataFrame
+    args:
+        created_from: str - optional inclusive lower bound of created_at ('YYYY-MM-DD[ HH:MM:SS]')
+        created_to: str - optional exclusive upper bound of created_at
+        columns: list - optional subset of the archive columns
+    returns:
+        pd.DataFrame - archived rows followed by live rows, ordered by id, every id once
+    """
+    columns = list(columns) if columns is not None else list(_ARCHIVE_COLUMNS)
+    # the id is always read, a row can be in two parts or in the archive and the live database
+    read_columns = columns if 'id' in columns else ['id', *columns]
+    frames = []
+
+    if glob.glob(os.path.join(archive_dir, 'day=*', '*.parquet')):
+        # the day= directories are read as a column too so whole partitions are skipped by the filter
+        dataset = ds.dataset(archive_dir, format='parquet', schema=ARCHIVE_SCHEMA.append(pa.field('day', pa.string())),
+                             partitioning=ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive'))
+        condition = None
+        if created_from is not None:
+            start = pd.Timestamp(created_from)
+            condition = (ds.field('day') >= start.strftime('%Y-%m-%d')) & \
+                        (ds.field('created_at') >= pa.scalar(start.to_pydatetime(), pa.timestamp('s')))
+        if created_to is not None:
+            end = pd.Timestamp(created_to)
+            term = (ds.field('day') <= end.strftime('%Y-%m-%d')) & \
+                   (ds.field('created_at') < pa.scalar(end.to_pydatetime(), pa.timestamp('s')))
+            condition = term if condition is None else condition & term
+        frames.append(dataset.to_table(columns=read_columns, filter=condition).to_pandas())
+
+    clauses, params = [], []
+    if created_from is not None:
+        clauses.append('created_at >= ?')
+        params.append(created_from)
+    if created_to is not None:
+        clauses.append('created_at < ?')
+        params.append(created_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with connection_manager.read_connection() as conn:
+        live = pd.read_sql_query(f"SELECT {', '.join(_ARCHIVE_COLUMNS)} FROM predictions {where}", conn, params=params)
+    frames.append(_to_archive_frame(live)[read_columns])
+
+    df = pd.concat([frame for frame in frames if not frame.empty] or frames[-1:], ignore_index=True)
+    df = df.drop_duplicates('id').sort_values('id', ignore_index=True)
+    return df[columns]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='move old predictions from predictions.db into parquet')
+    parser.add_argument('--retention-days', type=int, default=30)
+    parser.add_argument('--batch-rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    roll_over(retention_days=args.retention_days, batch_rows=args.batch_rows)
@@ -0,0 +1,109 @@
+import time
+import numbers
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value):
+    """Give equal numbers one representation so 3, 3.0, True/1 and numpy scalars share a key"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        return int(value) if value.is_integer() else value
+    return value
+
+
+def canonical_key(features, columns):
+    """Build the cache key of one feature dict as a tuple in the given column order"""
+    return tuple(_normalize(features[column]) for column in columns)
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predicted prices with an optional time to live.
+    Entries belong to one model version, asking with another version empties the cache
+    and a price computed with any other version than the current one is not stored.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=None):
+        self._max_size = max(1, int(max_size))
+        self._ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._stale_puts = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self._invalidations += 1
+                logger.info(f"Prediction cache invalidated for model version {version}")
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """Return the cached price of key for this model version, None on a miss"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            price, stored_at = entry
+            if self._ttl is not None and time.monotonic() - stored_at > self._ttl:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return price
+
+    def put(self, key, version, price):
+        """Store the price of key, evicting the least recently used entry when full"""
+        with self._lock:
+            if self._version is None:
+                self._version = version
+            elif version != self._version:
+                # computed with a model that was swapped out meanwhile, it must not reset the newer entries
+                self._stale_puts += 1
+                return
+            self._entries[key] = (price, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        """Hit, miss, eviction and stale put counters"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self._max_size,
+                'ttl_seconds': self._ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+                'stale_puts': self._stale_puts,
+                'version': self._version,
+            }
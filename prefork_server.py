@@ -0,0 +1,177 @@
+import os
+import gc
+import time
+import socket
+import signal
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+# a worker that dies sooner than this after starting counts as a crash loop and is restarted with a delay
+_MIN_WORKER_LIFETIME = 1.0
+_RESTART_DELAY = 1.0
+
+
+def _read_rss_kib(pid):
+    """Resident memory of a process in KiB from /proc, None where /proc is not available"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _run_worker(listener, host, port, flask_app):
+    """Serve the Flask app on the inherited listening socket until SIGTERM"""
+    from werkzeug.serving import make_server
+    from database import stop_write_behind
+
+    # threads of the master are gone after the fork, start this worker's own
+    os.environ['PREFORK_MASTER'] = '0'
+    flask_app.start_background_tasks()
+
+    server = make_server(host, port, flask_app.app, threaded=True, fd=listener.fileno())
+
+    def _stop(signum, frame):
+        # shutdown() waits for serve_forever() so it has to run on another thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    def _watch_master(master_pid):
+        # a worker whose master was killed is re-parented, stop instead of serving unsupervised
+        while os.getppid() == master_pid:
+            time.sleep(_MIN_WORKER_LIFETIME)
+        logger.error(f"Worker {os.getpid()} lost its master, stopping")
+        server.shutdown()
+
+    threading.Thread(target=_watch_master, args=(os.getppid(),), daemon=True).start()
+
+    logger.info(f"Worker {os.getpid()} serving (rss {_read_rss_kib(os.getpid())} KiB)")
+    server.serve_forever()
+
+    # answer the predictions still queued for micro-batching and write the buffered log before exiting
+    if flask_app.batcher is not None:
+        flask_app.batcher.stop()
+    stop_write_behind()
+
+
+class PreforkServer:
+    """
+    Loads the model artifacts once in the master process and forks workers that share
+    the loaded pages copy-on-write. Crashed workers are restarted, SIGHUP restarts every
+    worker one after another and SIGTERM/SIGINT stop the server.
+    """
+
+    def __init__(self, workers=2, host='0.0.0.0', port=2662, backlog=1024):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("the prefork server needs os.fork, use app.py or asgi_app.py on this platform.")
+        self._workers = max(1, int(workers))
+        self._host = host
+        self._port = port
+        self._backlog = backlog
+        self._children = {}
+        self._stopping = False
+        self._restart = []
+
+    def _spawn(self, listener, flask_app):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(listener, self._host, self._port, flask_app)
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} crashed")
+                code = 1
+            finally:
+                # never fall back into the master's loop or run its exit handlers
+                os._exit(code)
+        self._children[pid] = time.monotonic()
+        return pid
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _handle_reload(self, signum, frame):
+        # restart the workers one by one so the socket always has someone accepting
+        self._restart = list(self._children)
+        self._restart_next()
+
+    def _restart_next(self):
+        while self._restart:
+            pid = self._restart.pop()
+            if pid in self._children:
+                os.kill(pid, signal.SIGTERM)
+                return
+
+    def serve(self):
+        """Load the artifacts, fork the workers and supervise them until stopped"""
+        # the artifacts are loaded here once, memory mapped where joblib can, and inherited by the workers
+        os.environ['PREFORK_MASTER'] = '1'
+        os.environ.setdefault('MODEL_MMAP_MODE', 'r')
+        import app as flask_app
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self._host, self._port))
+        listener.listen(self._backlog)
+        listener.set_inheritable(True)
+
+        # move everything loaded so far out of the collector's reach so that
+        # collections in the workers do not write to (and copy) the shared pages
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        logger.info(f"Master {os.getpid()} listening on {self._host}:{self._port} "
+                    f"with {self._workers} workers (rss {_read_rss_kib(os.getpid())} KiB)")
+        for _ in range(self._workers):
+            self._spawn(listener, flask_app)
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started = self._children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+
+            if os.waitstatus_to_exitcode(status) != 0:
+                logger.error(f"Worker {pid} died with status {os.waitstatus_to_exitcode(status)}, restarting it")
+            if time.monotonic() - started < _MIN_WORKER_LIFETIME:
+                time.sleep(_RESTART_DELAY)
+            self._spawn(listener, flask_app)
+            self._restart_next()
+
+        listener.close()
+        logger.info("Prefork server stopped")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='serve app.py with several forked workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=2662)
+    args = parser.parse_args()
+
+    PreforkServer(workers=args.workers, host=args.host, port=args.port).serve()
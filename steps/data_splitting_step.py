@@ -5,7 +5,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import numpy
 import pandas as pd
 import logging
-from _src.data_splitting import SelectSplitter, TestTrainSplit
+from _src.data_splitting import SelectSplitter, TestTrainSplit, read_split, write_folds
+from _src.data_ingestion import read_raw_data
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -20,13 +21,16 @@ def _split_data(path):
     """
     logging.info("Data spltting has started")
 
-    # load the raw data
-    df = pd.DataFrame(pd.read_csv(path))
+    # load the raw data with the compact types
+    df = read_raw_data(path)
 
     split = SelectSplitter(test_size=0.2,random_state=42,target_var='price')
     split.set_splitter(TestTrainSplit)
     split.execute_splitter(df)
 
+    # the folds of the train set are made once here and shared by every model and search
+    write_folds(read_split('y_train')['price'], n_splits=10, n_bins=5, random_state=42)
+
     logging.info("Data splitting has ended")
 
 
@@ -5,6 +5,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import numpy
 import pandas as pd
 import logging
+from _src.data_splitting import read_split
 from _src.feature_engineering import selectFeatureEngineeringStrtegy, x_FetureEngineering, y_FetureEngineering
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -47,9 +48,9 @@ def _feature_engineer(x_train: pd.DataFrame, x_test: pd.DataFrame, y_train: pd.D
     logging.info("feature engineering has ended..")
     
 
-x_train = pd.DataFrame(pd.read_csv('data/splitted_data/x_train.csv'))
-x_test = pd.DataFrame(pd.read_csv('data/splitted_data/x_test.csv'))
-y_train = pd.DataFrame(pd.read_csv('data/splitted_data/y_train.csv'))
-y_test = pd.DataFrame(pd.read_csv('data/splitted_data/y_test.csv'))
+x_train = read_split('x_train')
+x_test = read_split('x_test')
+y_train = read_split('y_train')
+y_test = read_split('y_test')
 
 _feature_engineer(x_train,x_test,y_train,y_test)
\ No newline at end of file
@@ -4,7 +4,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import numpy
 import pandas as pd
-from _src.data_ingestion import SelectDataIngestor, ZipfileDataIngestor
+from _src.data_ingestion import SelectDataIngestor, StreamingZipDataIngestor
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,11 +21,13 @@ def _data_ingestion_step(file_path: str):
     logging.info("Data ingestion has started.")
 
     ingestor = SelectDataIngestor()
-    ingestor.set_ingestor(ZipfileDataIngestor)
+    ingestor.set_ingestor(StreamingZipDataIngestor)
 
     ingestor.execute_ingestor(file_path)
 
     logging.info("Data ingestion has ended.")
 
-_data_ingestion_step('data/zip_data/archive.zip')
-    
+
+if __name__ == "__main__":
+    _data_ingestion_step('data/zip_data/archive.zip')
+
@@ -6,17 +6,20 @@ import numpy
 import pandas as pd
 import logging
 import joblib
+from _src.feature_engineering import load_array
 from _src.model_building import selectmodel, LinearRegressionModel, StackingModels
+from _src.data_splitting import SPLIT_DIR, FOLDS_FILE, load_folds
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def _build_model(df_train, df_pred, model: str):
+def _build_model(df_train, df_pred, model: str, cv=10):
     """
     we will train the model
     args:
         df_train - this will hold the x_train part of oour data
         df_pred - this the corresponding y_train data
         model: str - this will lets us decide whether we will use the linear regressor or model stacking ['linear','stacking']
+        cv - the number of folds or the saved folds
     returns
         none
     """
@@ -24,13 +27,15 @@ def _build_model(df_train, df_pred, model: str):
 
     strategy = selectmodel()
 
-    strategy.execute_model_train(df_train=df_train,df_pred=df_pred,model=model)
+    strategy.execute_model_train(df_train=df_train,df_pred=df_pred,model=model,cv=cv)
 
     logging.info("model building has ended...")
 
 # load the data
-df_train = joblib.load('data/arr_data/x_train.npy')
-df_pred = joblib.load('data/arr_data/y_train.npy')
+df_train = load_array('data/arr_data/x_train.npy')
+df_pred = load_array('data/arr_data/y_train.npy')
 
+# the folds made by the splitting step, so every model is searched on the same folds
+cv = load_folds(n_rows=len(df_train)) if os.path.exists(os.path.join(SPLIT_DIR, FOLDS_FILE)) else 10
 
-_build_model(df_train=df_train,df_pred=df_pred,model='linear') # i will comment out to avoid retraining the model in an existing nun name which could cause errors
\ No newline at end of file
+_build_model(df_train=df_train,df_pred=df_pred,model='linear',cv=cv) # i will comment out to avoid retraining the model in an existing nun name which could cause errors
\ No newline at end of file
@@ -6,6 +6,7 @@ import numpy
 import pandas as pd
 import logging
 import joblib
+from _src.feature_engineering import load_array
 from _src.model_evaluation import selectEvaluator, EvaluateLinearModel, EvaluateStackingModel
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -29,7 +30,7 @@ def _evaluate_model(df_test, df_pred, evaluator: str, r2_value: bool=False, MSE:
     logging.info("model evaluation has ended...")
 
 # load the data
-df_test = joblib.load('data/arr_data/x_test.npy')
-df_pred = joblib.load('data/arr_data/y_test.npy')
+df_test = load_array('data/arr_data/x_test.npy')
+df_pred = load_array('data/arr_data/y_test.npy')
 
 _evaluate_model(df_test=df_test,df_pred=df_pred,evaluator='linear',r2_value=True,MSE=True,RMSE=True,MAE=True) # i will comment out to avoid re-evaluating the model in an existing run name which could cause errors
\ No newline at end of file
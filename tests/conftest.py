@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# the modules live in the repository root and in _src, which are not installed as a package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+import prediction_archive
+
+
+@pytest.fixture
+def connection_manager(tmp_path, monkeypatch):
+    """A predictions database in tmp_path that every module uses instead of predictions.db"""
+    manager = database.ConnectionManager(str(tmp_path / 'predictions.db'))
+    monkeypatch.setattr(database, 'connection_manager', manager)
+    monkeypatch.setattr(prediction_archive, 'connection_manager', manager)
+    database.init_db()
+    yield manager
+    manager.close()
+
+
+def prediction_row(price=100000.0, name='test', area=5000.0):
+    """One row of PREDICTION_COLUMNS values"""
+    return (name, area, 3, 2.0, 2, 1, 0, 0, 0, 1, 1, 0, 'furnished', price)
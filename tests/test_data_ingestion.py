@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from _src.data_ingestion import IngestionManifest
+
+
+CONFIG = {'ingestor': 'CSVDataIngestor', 'schema': 'compact'}
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    """A source and its output, recorded in a manifest"""
+    source, output = tmp_path / 'raw.csv', tmp_path / 'raw.parquet'
+    source.write_text('price,area\n1,2\n')
+    output.write_bytes(b'output')
+    manifest = IngestionManifest(str(tmp_path / 'manifest.json'))
+    manifest.record(str(source), str(output), CONFIG)
+    return manifest, source, output
+
+
+def test_an_unchanged_source_is_fresh(recorded):
+    manifest, source, output = recorded
+    assert manifest.is_fresh(str(source), str(output), CONFIG)
+
+
+def test_a_touched_but_unchanged_source_is_fresh(recorded):
+    manifest, source, output = recorded
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert manifest.is_fresh(str(source), str(output), CONFIG)
+
+
+def test_a_changed_source_is_not_fresh(recorded):
+    manifest, source, output = recorded
+    source.write_text('price,area\n1,3\n')
+    assert not manifest.is_fresh(str(source), str(output), CONFIG)
+
+
+def test_a_changed_output_is_not_fresh(recorded):
+    manifest, source, output = recorded
+    output.write_bytes(b'edited')
+    assert not manifest.is_fresh(str(source), str(output), CONFIG)
+
+
+def test_a_missing_output_is_not_fresh(recorded):
+    manifest, source, output = recorded
+    output.unlink()
+    assert not manifest.is_fresh(str(source), str(output), CONFIG)
+
+
+def test_another_config_is_not_fresh(recorded):
+    manifest, source, output = recorded
+    assert not manifest.is_fresh(str(source), str(output), {**CONFIG, 'schema': 'full'})
+
+
+def test_another_source_is_not_fresh(recorded, tmp_path):
+    manifest, source, output = recorded
+    other = tmp_path / 'other.csv'
+    other.write_text(source.read_text())
+    assert not manifest.is_fresh(str(other), str(output), CONFIG)
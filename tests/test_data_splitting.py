@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import numpy
+import pandas as pd
+import pytest
+
+from _src.data_ingestion import read_raw_data
+from _src.data_splitting import HashSplit, IndexSplit, read_split, read_index_split, iter_split_chunks
+
+RAW_CSV = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw_data', 'raw.csv')
+
+
+@pytest.fixture(scope='module')
+def houses():
+    return read_raw_data(RAW_CSV)
+
+
+def _splitter(**options):
+    return HashSplit(test_size=0.2, random_state=42, target_var='price', **options)
+
+
+def test_hash_split_does_not_depend_on_the_chunks_or_the_order(houses):
+    splitter = _splitter()
+    whole = splitter.assign(houses)
+    chunked = numpy.concatenate([splitter.assign(houses.iloc[i:i + 37]) for i in range(0, len(houses), 37)])
+    order = numpy.random.default_rng(0).permutation(len(houses))
+    shuffled = numpy.empty(len(houses), dtype=bool)
+    shuffled[order] = splitter.assign(houses.iloc[order])
+
+    numpy.testing.assert_array_equal(whole, chunked)
+    numpy.testing.assert_array_equal(whole, shuffled)
+    assert 0.1 < whole.mean() < 0.3
+
+
+def test_hash_split_keeps_the_rows_in_their_set_when_rows_arrive(houses):
+    splitter = _splitter(key=['area', 'bedrooms', 'price'])
+    before = splitter.assign(houses.iloc[:300])
+    after = splitter.assign(houses)
+    numpy.testing.assert_array_equal(before, after[:300])
+
+
+def test_hash_split_salt_gives_another_split(houses):
+    other = HashSplit(test_size=0.2, random_state=7, target_var='price')
+    assert (_splitter().assign(houses) != other.assign(houses)).any()
+
+
+def test_hash_split_writes_every_row_once(houses, tmp_path):
+    _splitter(path=str(tmp_path)).split([houses.iloc[:200], houses.iloc[200:]])
+    x = pd.concat([read_split('x_train', path=str(tmp_path)), read_split('x_test', path=str(tmp_path))])
+    y = pd.concat([read_split('y_train', path=str(tmp_path)), read_split('y_test', path=str(tmp_path))])
+    assert len(x) == len(y) == len(houses)
+    assert len(read_split('x_test', path=str(tmp_path))) == _splitter().assign(houses).sum()
+
+
+def test_index_split_refuses_a_changed_source(houses, tmp_path):
+    source = str(tmp_path / 'raw.csv')
+    shutil.copyfile(RAW_CSV, source)
+    IndexSplit(test_size=0.2, random_state=42, target_var='price', source_path=source, path=str(tmp_path)).split(houses)
+
+    chunks = list(iter_split_chunks('x_train', chunksize=100, path=str(tmp_path)))
+    assert sum(len(chunk) for chunk in chunks) == len(read_index_split('x_train', path=str(tmp_path)))
+
+    with open(source, 'a') as raw:
+        raw.write('1,1,1,1,1,no,no,no,no,no,0,no,furnished\n')
+    with pytest.raises(ValueError):
+        read_index_split('x_train', path=str(tmp_path))
+    with pytest.raises(ValueError):
+        next(iter_split_chunks('x_train', path=str(tmp_path)))
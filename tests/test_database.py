@@ -0,0 +1,102 @@
+import math
+
+import pytest
+
+import database
+from conftest import prediction_row
+
+
+def _count(manager):
+    with manager.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+
+def _insert(manager, rows, created_at):
+    with manager.connection() as conn:
+        with conn:
+            for row, timestamp in zip(rows, created_at):
+                conn.execute(
+                    f"INSERT INTO predictions ({', '.join(database.PREDICTION_COLUMNS)}, created_at) "
+                    f"VALUES ({', '.join('?' * (len(database.PREDICTION_COLUMNS) + 1))})",
+                    (*row, timestamp)
+                )
+
+
+def test_log_writer_flushes_everything_on_stop(connection_manager):
+    writer = database.PredictionLogWriter(manager=connection_manager, flush_rows=3, flush_ms=10000).start()
+    for i in range(7):
+        assert writer.add(prediction_row(price=float(i)))
+    writer.stop()
+
+    metrics = writer.metrics()
+    assert _count(connection_manager) == 7
+    assert metrics['flushed_rows'] == 7
+    assert metrics['buffered'] == 0
+    assert metrics['failed_rows'] == metrics['dropped_rows'] == metrics['rejected_rows'] == 0
+
+
+def test_log_writer_rejects_non_finite_prices(connection_manager):
+    writer = database.PredictionLogWriter(manager=connection_manager)
+    assert not writer.add(prediction_row(price=math.nan))
+    assert not writer.add(prediction_row(price=math.inf))
+    assert not writer.add(prediction_row(price=None))
+    assert writer.metrics()['rejected_rows'] == 3
+    assert writer.metrics()['buffered'] == 0
+
+
+def test_log_writer_loses_only_the_failing_row(connection_manager):
+    writer = database.PredictionLogWriter(manager=connection_manager)
+    # a row that passes add() but breaks the NOT NULL constraint fails the batch insert
+    writer._write([prediction_row(), prediction_row(name=None), prediction_row()])
+
+    metrics = writer.metrics()
+    assert metrics['flushed_rows'] == 2
+    assert metrics['failed_rows'] == 1
+    assert _count(connection_manager) == 2
+
+
+def test_log_writer_drops_rows_when_full(connection_manager):
+    writer = database.PredictionLogWriter(manager=connection_manager, capacity=2, block_ms=0)
+    assert writer.add(prediction_row())
+    assert writer.add(prediction_row())
+    assert not writer.add(prediction_row())
+    assert writer.metrics()['dropped_rows'] == 1
+
+
+def test_save_prediction_batch_skips_non_finite_prices(connection_manager):
+    rows = [dict(zip(database.PREDICTION_COLUMNS, prediction_row(price=price))) for price in (1.0, math.nan, 3.0)]
+    assert database.save_prediction_batch(rows) == 2
+    assert _count(connection_manager) == 2
+
+
+def test_query_predictions_pages_through_ties_without_gaps(connection_manager):
+    # three rows share every timestamp, so the id has to break the ties between pages
+    timestamps = [f'2024-01-0{day} 12:00:00' for day in (1, 2, 3) for _ in range(3)]
+    _insert(connection_manager, [prediction_row(price=float(i)) for i in range(len(timestamps))], timestamps)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = database.query_predictions(limit=2, cursor=cursor)
+        seen.extend((row['created_at'], row['id']) for row in rows)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 5
+    assert len(seen) == len(set(seen)) == 9
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_query_predictions_last_full_page_has_no_cursor(connection_manager):
+    _insert(connection_manager, [prediction_row() for _ in range(4)], ['2024-01-01 00:00:00'] * 4)
+
+    rows, cursor = database.query_predictions(limit=2)
+    assert len(rows) == 2 and cursor is not None
+    rows, cursor = database.query_predictions(limit=2, cursor=cursor)
+    assert len(rows) == 2 and cursor is None
+
+
+def test_query_predictions_cursor_round_trip():
+    assert database.decode_cursor(database.encode_cursor('2024-01-01 00:00:00', 42)) == ('2024-01-01 00:00:00', 42)
+    with pytest.raises(ValueError):
+        database.decode_cursor('not a cursor')
@@ -0,0 +1,67 @@
+import numpy
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import PowerTransformer, RobustScaler
+
+from model_kernel import compile_model, verify_kernel
+from _src.categorical_encoding import DictionaryEncoder, FLAG_VOCABULARY, FLAG_ALIASES
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    """A small pipeline with every branch the feature engineering uses, fitted on random houses"""
+    rng = numpy.random.default_rng(0)
+    n = 200
+    X = pd.DataFrame({
+        'area': rng.lognormal(8.5, 0.4, n),
+        'bathrooms': rng.integers(1, 4, n).astype(float),
+        'stories': rng.integers(1, 5, n),
+        'mainroad': rng.choice(['yes', 'no'], n),
+        'furnishingstatus': rng.choice(['furnished', 'semi-furnished', 'unfurnished'], n),
+    })
+    y = 50 * X['area'] + 1e5 * X['bathrooms'] + 2e5 * (X['mainroad'] == 'yes') + rng.normal(0, 1e4, n) + 1e6
+
+    preprocessor = ColumnTransformer([
+        ('remove skewness', PowerTransformer(), ['area', 'bathrooms']),
+        ('deal with outliers', RobustScaler(), ['area', 'stories']),
+        ('one hot encode cat cols', DictionaryEncoder(output='onehot'), ['furnishingstatus']),
+        ('map binary cols', DictionaryEncoder(categories=[FLAG_VOCABULARY], aliases=FLAG_ALIASES, output='ordinal'),
+         ['mainroad']),
+    ])
+    target_pipeline = Pipeline([('remove skewness', PowerTransformer()), ('deal with outliers', RobustScaler())])
+    model = LinearRegression().fit(preprocessor.fit_transform(X),
+                                   target_pipeline.fit_transform(y.to_frame()).ravel())
+    return model, preprocessor, target_pipeline, X
+
+
+def test_kernel_matches_the_sklearn_path(fitted):
+    model, preprocessor, target_pipeline, X = fitted
+    kernel = compile_model(model, preprocessor, target_pipeline)
+    assert verify_kernel(kernel, model, preprocessor, target_pipeline, X) < 1e-3
+
+
+def test_kernel_accepts_the_flag_aliases(fitted):
+    model, preprocessor, target_pipeline, X = fitted
+    kernel = compile_model(model, preprocessor, target_pipeline)
+    record = X.iloc[0].to_dict()
+    prices = {kernel.predict_one({**record, 'mainroad': value}) for value in ('yes', '1', 'Yes', 'true')}
+    assert len(prices) == 1
+
+
+def test_verify_kernel_rejects_a_wrong_kernel(fitted):
+    model, preprocessor, target_pipeline, X = fitted
+    kernel = compile_model(model, preprocessor, target_pipeline)
+    kernel.intercept += 0.1
+    with pytest.raises(ValueError):
+        verify_kernel(kernel, model, preprocessor, target_pipeline, X)
+
+
+def test_a_saved_kernel_predicts_the_same(fitted, tmp_path):
+    model, preprocessor, target_pipeline, X = fitted
+    kernel = compile_model(model, preprocessor, target_pipeline)
+    kernel.save(str(tmp_path / 'kernel.npz'))
+    loaded = type(kernel).load(str(tmp_path / 'kernel.npz'))
+    numpy.testing.assert_allclose(loaded.predict(X), kernel.predict(X))
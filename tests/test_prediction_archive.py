@@ -0,0 +1,56 @@
+import glob
+import os
+from datetime import datetime, timedelta, timezone
+
+import prediction_archive
+from database import INSERT_PREDICTION_SQL
+from conftest import prediction_row
+
+
+def _days_ago(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _fill(manager, old=10, new=3):
+    with manager.connection() as conn:
+        with conn:
+            for i in range(old + new):
+                conn.execute(INSERT_PREDICTION_SQL, prediction_row(price=float(i)))
+            # the first rows are older than the retention, one of them a day older than the others
+            conn.execute('UPDATE predictions SET created_at = ? WHERE id <= ?', (_days_ago(40), old))
+            conn.execute('UPDATE predictions SET created_at = ? WHERE id = 1', (_days_ago(41),))
+
+
+def test_roll_over_moves_old_rows_once(connection_manager, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    _fill(connection_manager)
+    before = prediction_archive.read_predictions(archive_dir=archive_dir)
+
+    assert prediction_archive.roll_over(retention_days=30, batch_rows=4, archive_dir=archive_dir, vacuum=False) == 10
+    first = prediction_archive.read_predictions(archive_dir=archive_dir)
+    assert prediction_archive.roll_over(retention_days=30, batch_rows=4, archive_dir=archive_dir, vacuum=False) == 0
+    second = prediction_archive.read_predictions(archive_dir=archive_dir)
+
+    assert len(glob.glob(os.path.join(archive_dir, 'day=*'))) == 2
+    assert first['id'].tolist() == second['id'].tolist() == before['id'].tolist() == list(range(1, 14))
+    assert first['predicted_price'].tolist() == before['predicted_price'].tolist()
+
+
+def test_a_retried_batch_is_read_and_compacted_once(connection_manager, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    _fill(connection_manager, old=10, new=0)
+    prediction_archive.roll_over(retention_days=30, batch_rows=100, archive_dir=archive_dir, vacuum=False)
+
+    # a retry that picked up a different id range leaves a second part with the same rows
+    archived = prediction_archive.read_predictions(archive_dir=archive_dir)
+    day = archived['created_at'].iloc[-1].strftime('%Y-%m-%d')
+    rows = archived[archived['created_at'].dt.strftime('%Y-%m-%d') == day].head(5)
+    prediction_archive._write_partition(rows, day, archive_dir)
+
+    assert prediction_archive.read_predictions(archive_dir=archive_dir)['id'].tolist() == list(range(1, 11))
+    assert prediction_archive.read_predictions(archive_dir=archive_dir, columns=['predicted_price']).shape == (10, 1)
+
+    assert prediction_archive.compact_archive(archive_dir, min_files=2) == 1
+    parts = glob.glob(os.path.join(archive_dir, f'day={day}', '*.parquet'))
+    assert len(parts) == 1
+    assert prediction_archive.read_predictions(archive_dir=archive_dir)['id'].tolist() == list(range(1, 11))